@@ -77,7 +77,10 @@ a = Analysis(
         'PIL',
         'PIL._tkinter_finder',
         'pynput.keyboard._darwin',
-        'pynput.mouse._darwin'
+        'pynput.mouse._darwin',
+        # Run with runpy from freetime.py, so the analysis can't see them
+        'freetime_daemon',
+        'freetime_cli'
     ],
     hookspath=['.'],
     hooksconfig={},
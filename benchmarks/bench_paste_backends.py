@@ -0,0 +1,59 @@
+"""
+Latency benchmark for the paste backends.
+
+Inserts a typical availability text with the clipboard backend (copy, wait
+for the clipboard, paste shortcut) and with the typing backend (synthetic
+Unicode key events), and prints how long each call takes.
+
+This really types into the focused window: start it, then click into an
+empty text editor before the countdown ends.
+
+    python benchmarks/bench_paste_backends.py [runs]
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'source'))
+
+import pyperclip
+
+import paste_engine
+
+TEXT = ("I'm free at the following times...\n"
+        "Mon 19th Oct: 9am, 12pm, 3pm\n"
+        "Tue 20th Oct: 9am, 10am, 12pm, 1pm, 2pm, 3pm\n"
+        "Wed 21st Oct: 10am, 11am, 12pm, 1pm, 2pm, 3pm\n"
+        "Thu 22nd Oct: 9am, 10:30am, 2pm\n"
+        "Fri 23rd Oct: 10am, 11am, 12pm, 1pm, 2pm, 3pm\n")
+COUNTDOWN = 5
+# Gap between runs so the target app can catch up
+SETTLE = 0.5
+
+
+def bench(backend, runs):
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        saved = paste_engine.paste_text(TEXT, backend)
+        times.append(time.perf_counter() - t0)
+        time.sleep(SETTLE)
+        if saved is not None:
+            paste_engine.restore_clipboard(*saved)
+    print(f"{backend:<10} median {statistics.median(times) * 1000:7.2f} ms  "
+          f"min {min(times) * 1000:7.2f} ms  max {max(times) * 1000:7.2f} ms")
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    print(f"{len(TEXT)} characters, {runs} runs per backend. Focus a text editor...")
+    for i in range(COUNTDOWN, 0, -1):
+        print(f"  {i}")
+        time.sleep(1)
+    original = pyperclip.paste()
+    try:
+        for backend in paste_engine.BACKENDS:
+            bench(backend, runs)
+    finally:
+        pyperclip.copy(original)
@@ -0,0 +1,76 @@
+"""
+Microbenchmark for the keystroke trigger matcher.
+
+Feeds a stream of random keys through TriggerMatcher and through the
+string-buffer scan it replaced, and prints the cost per key.
+
+    python benchmarks/bench_trigger_matcher.py
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'source'))
+
+from trigger_matcher import TriggerMatcher
+
+TRIGGERS = [':tt', ':tt30', ':ttw', ':tt2w', ':ttv']
+KEYS = 1_000_000
+
+
+def make_keys(n):
+    rnd = random.Random(0)
+    alphabet = string.ascii_lowercase + ' :t3'
+    keys = [rnd.choice(alphabet) for _ in range(n)]
+    # sprinkle in some backspaces
+    for i in range(0, n, 97):
+        keys[i] = '\b'
+    return keys
+
+
+def run_matcher(keys):
+    matcher = TriggerMatcher(TRIGGERS)
+    hits = 0
+    for ch in keys:
+        if ch == '\b':
+            matcher.backspace()
+        elif matcher.feed(ch):
+            hits += 1
+    return hits
+
+
+def run_buffer_scan(keys):
+    """The previous approach: append to a string buffer and test every trigger"""
+    buffer = ""
+    hits = 0
+    for ch in keys:
+        if ch == '\b':
+            buffer = buffer[:-1]
+            continue
+        buffer += ch
+        if len(buffer) > 20:
+            buffer = buffer[-20:]
+        for trigger in TRIGGERS:
+            if trigger in buffer:
+                hits += 1
+                buffer = ""
+                break
+    return hits
+
+
+def bench(name, fn, keys):
+    best = float('inf')
+    for _ in range(5):
+        t0 = time.perf_counter()
+        hits = fn(keys)
+        best = min(best, time.perf_counter() - t0)
+    print(f"{name:<14} {best / len(keys) * 1e9:7.1f} ns/key  ({hits} triggers)")
+
+
+if __name__ == '__main__':
+    keys = make_keys(KEYS)
+    print(f"{KEYS} keys, {len(TRIGGERS)} triggers: {', '.join(TRIGGERS)}")
+    bench("TriggerMatcher", run_matcher, keys)
+    bench("buffer scan", run_buffer_scan, keys)
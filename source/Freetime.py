@@ -1,47 +1,46 @@
-import requests
-from datetime import datetime, timedelta
+import sys
+import import_profile
+
+# Parse worker processes (see parse_worker) start by re-running this
+# executable when frozen; freeze_support() hands them over to multiprocessing
+if __name__ == "__main__" and getattr(sys, 'frozen', False):
+    import multiprocessing
+    multiprocessing.freeze_support()
+
+# The headless daemon and the CLI must not import the GUI and keyboard
+# modules below.  They run as __main__ in place of this script, so spawned
+# parse workers re-import them rather than this module
+if __name__ == "__main__" and ("--headless" in sys.argv[1:] or sys.argv[1:2] == ["query"]):
+    import runpy
+    runpy.run_module('freetime_daemon' if "--headless" in sys.argv[1:] else 'freetime_cli',
+                     run_name="__main__", alter_sys=True)
+    sys.exit(0)
+
 import pytz
-import pyperclip
-from typing import List, Dict, Set
-from datetime import date
-import pystray
 import threading
 import time
-import pyautogui
 import tempfile
 import os
-import json
 import logging
-import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
-import sys
+import queue
+import atexit
 from pathlib import Path
 import platform
 import subprocess
-import tkinter.font as tk_font
-from PIL import Image, ImageTk
-from icalendar import Calendar
-from typing import List, Dict, Set, Tuple
-
-
-version_string = "0.99"
-# Changelog
-#1
-
-# v0.99 8/5/25
-# Working well across platforms
-
-# v091 1/5/25
-# Fix logging code so that it works across platforms
-
-# v09 25/4/25
-# fixed an error where recurring events created before daylight saving change are processed incorrectly after daylight savings.
-
-# v0.8 7/3/25
-# Added option to ignore allday and multi-day events
+with import_profile.timed('tkinter'):
+    import tkinter as tk
+    from tkinter import ttk, messagebox, simpledialog
+    import tkinter.font as tk_font
+from trigger_matcher import TriggerMatcher
+with import_profile.timed('freetime_engine'):
+    from freetime_engine import (
+        FreeTimeEngine, APP_DIR, SETTINGS_FILE, LOG_FILE, version_string,
+        read_log_newest_first, setup_logging, stop_log_listener
+    )
+# PIL, pystray, pyperclip and paste_engine (pyautogui) are imported on
+# first use, so the cached free slots are ready before they load
+import_profile.mark("Core modules imported")
 
-# v0.7 3/3/25
-# Switched to text replacement rather than hotkey
 
 def get_resource_path(relative_path):
     """Get absolute path to resource, works for dev and for PyInstaller"""
@@ -53,76 +52,6 @@ def get_resource_path(relative_path):
 
     return os.path.join(base_path, relative_path)
 
-def get_app_directory():
-    """Get the directory where the app is running from"""
-    if getattr(sys, 'frozen', False):
-        # If the application is run as a bundle (compiled)
-        return Path(sys.executable).parent
-    else:
-        # If the application is run from a Python interpreter
-        return Path(__file__).parent
-
-class NewestFirstLogHandler(logging.FileHandler):
-    MAX_ENTRIES = 1000
-
-    def emit(self, record):
-        try:
-            lines = []
-            if os.path.exists(self.baseFilename):
-                try:
-                    # Explicitly use utf-8 encoding and ignore errors on read
-                    with open(self.baseFilename, 'r', encoding='utf-8', errors='ignore') as f:
-                        lines = f.readlines()
-                except Exception as e:
-                    # Log an error if reading fails, but continue
-                    logging.error(f"Error reading log file {self.baseFilename}: {e}", exc_info=True)
-                    lines = [] # Start fresh if read fails
-
-            # Add new log entry at the beginning
-            new_log_line = self.format(record) + '\n'
-            lines.insert(0, new_log_line)
-
-            # Keep only the most recent MAX_ENTRIES
-            lines = lines[:self.MAX_ENTRIES]
-
-            try:
-                # Explicitly use utf-8 encoding for writing
-                with open(self.baseFilename, 'w', encoding='utf-8') as f:
-                    f.writelines(lines)
-            except Exception as e:
-                 logging.error(f"Error writing log file {self.baseFilename}: {e}", exc_info=True)
-                 # If writing fails, we might lose logs, but the app shouldn't crash
-
-        except Exception:
-            self.handleError(record) # Use standard error handling if something else goes wrong
-
-# Set up app paths
-APP_DIR = get_app_directory()
-SETTINGS_FILE = APP_DIR / 'calendar_settings.json'
-LOG_FILE = APP_DIR / 'freetime.log'
-
-try:
-    # Test write permissions by touching the files
-    SETTINGS_FILE.touch(exist_ok=True)
-    LOG_FILE.touch(exist_ok=True)
-except PermissionError:
-    # If we can't write to the app directory, fall back to user's temp directory
-    temp_dir = Path(tempfile.gettempdir()) / 'CalendarApp'
-    temp_dir.mkdir(exist_ok=True)
-    SETTINGS_FILE = temp_dir / 'calendar_settings.json'
-    LOG_FILE = temp_dir / 'calendar_app.log'
-    logging.warning(f"Cannot write to app directory. Using temporary directory: {temp_dir}")
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO, # should be .INFO
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        NewestFirstLogHandler(LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
-
 class AboutWindow:
     def __init__(self, root, icon_image):
         self.window = tk.Toplevel()
@@ -148,6 +77,7 @@ class AboutWindow:
 
         # Set window icon (same for all platforms)
         try:
+            from PIL import ImageTk
             icon_photo = ImageTk.PhotoImage(icon_image)
             self.window.iconphoto(True, icon_photo)
             self.icon_photo = icon_photo  # Keep a reference
@@ -165,6 +95,7 @@ class AboutWindow:
 
         # Display logo
         try:
+            from PIL import Image, ImageTk
             logo_size = (100, 100)
             logo_image = icon_image.resize(logo_size, Image.Resampling.LANCZOS)
             photo = ImageTk.PhotoImage(logo_image)
@@ -291,11 +222,12 @@ class SettingsWindow:
         self.app = app
         self.window = tk.Toplevel(root)
         self.window.title("FreeTime Settings")
-        self.window.geometry("500x740")
+        self.window.geometry("500x810")
 
         # Set the window icon
         try:
             # Convert PIL image to PhotoImage for Tkinter
+            from PIL import ImageTk
             icon_photo = ImageTk.PhotoImage(self.app.icon_image)
             self.window.iconphoto(True, icon_photo)
             # Keep a reference to prevent garbage collection
@@ -314,14 +246,18 @@ class SettingsWindow:
         self.window.focus_force()
 
     def open_log_file(self, event):
-        """Open the log file with the default system application"""
+        """Write a newest-first copy of the log and open it with the default system application"""
         try:
+            view_file = Path(tempfile.gettempdir()) / 'freetime_log_view.txt'
+            with open(view_file, 'w', encoding='utf-8') as f:
+                f.write(read_log_newest_first(LOG_FILE))
+
             if platform.system() == 'Windows':
-                os.startfile(LOG_FILE)
+                os.startfile(view_file)
             elif platform.system() == 'Darwin':  # macOS
-                subprocess.run(['open', LOG_FILE])
+                subprocess.run(['open', view_file])
             else:  # Linux
-                subprocess.run(['xdg-open', LOG_FILE])
+                subprocess.run(['xdg-open', view_file])
         except Exception as e:
             logging.error(f"Failed to open log file: {e}")
             messagebox.showerror("Error", f"Could not open log file: {e}")
@@ -453,6 +389,12 @@ class SettingsWindow:
         self.timezone_combo['values'] = pytz.all_timezones
         self.timezone_combo.grid(row=5, column=1, sticky=(tk.W, tk.E), pady=5)
 
+        # Slot Length
+        ttk.Label(time_frame, text="Slot Length (minutes):").grid(row=6, column=0, sticky=tk.W, pady=5)
+        self.slot_minutes_var = tk.IntVar(value=self.app.slot_minutes)
+        ttk.Combobox(time_frame, textvariable=self.slot_minutes_var, values=(15, 30, 45, 60),
+                     width=5, state='readonly').grid(row=6, column=1, sticky=tk.W, pady=5)
+
         current_row += 1
 
         # App Settings Section (with bold label)
@@ -472,12 +414,19 @@ class SettingsWindow:
         self.trigger_text_entry = ttk.Entry(app_frame, textvariable=self.trigger_text_var)
         self.trigger_text_entry.grid(row=1, column=1, sticky=(tk.W, tk.E))
 
+        # Paste Method (stored per platform)
+        ttk.Label(app_frame, text="Paste Method:").grid(row=2, column=0, sticky=tk.W, pady=5)
+        self.paste_backend_var = tk.StringVar(value=self.app.current_paste_backend())
+        import paste_engine
+        ttk.Combobox(app_frame, textvariable=self.paste_backend_var, values=paste_engine.BACKENDS,
+                     width=10, state='readonly').grid(row=2, column=1, sticky=tk.W, pady=5)
+
         # Startup checkbox
         self.startup_var = tk.BooleanVar(value=self.check_startup())
         startup_cb = ttk.Checkbutton(app_frame, text="Run at startup",
                                      variable=self.startup_var,
                                      command=self.toggle_startup)
-        startup_cb.grid(row=2, column=0, columnspan=2, sticky=tk.W, pady=5)
+        startup_cb.grid(row=3, column=0, columnspan=2, sticky=tk.W, pady=5)
 
         current_row += 1
 
@@ -527,7 +476,7 @@ class SettingsWindow:
 
         # Ensure the window is large enough to show all content
         self.window.update_idletasks()
-        min_height = 740  # Set minimum height
+        min_height = 810  # Set minimum height
         current_height = self.window.winfo_height()
         if current_height < min_height:
             self.window.geometry(f"{self.window.winfo_width()}x{min_height}")
@@ -572,6 +521,7 @@ class SettingsWindow:
                     self.app.trigger_patterns = [new_trigger.lower()]
 
                 logging.info(f"Updated trigger patterns list: {self.app.trigger_patterns}")
+                self.app.rebuild_trigger_matcher()
 
                 # No need to restart the listener on macOS - it will use the updated patterns list
                 # For Windows, we need to update the hotkey
@@ -584,11 +534,14 @@ class SettingsWindow:
             self.app.start_of_day = self.start_hour_var.get()
             self.app.end_of_day = self.end_hour_var.get()
             self.app.lookahead_days = self.lookahead_var.get()
+            self.app.slot_minutes = self.slot_minutes_var.get()
             self.app.update_interval = self.interval_var.get() * 60
             self.app.custom_text = self.custom_text_var.get()
             self.app.exclude_weekends = self.exclude_weekends_var.get()
             self.app.include_current_day = self.include_current_day_var.get()
             self.app.ignore_all_day_events = self.ignore_all_day_events_var.get()
+            self.app.paste_backend = dict(self.app.paste_backend)
+            self.app.paste_backend[platform.system()] = self.paste_backend_var.get()
 
             # Save settings to file
             self.app.save_settings()
@@ -774,37 +727,40 @@ Comment=Calendar Free Time Finder"""
             result.extend(self._find_all_widgets(child, widget_type))
         return result
 
+class CalendarApp(FreeTimeEngine):
+    # Seconds before the clipboard is restored after a paste.  The restore
+    # runs on a timer, so this doesn't hold up the paste; macOS apps can
+    # take a while to read the clipboard after Cmd+V
+    CLIPBOARD_RESTORE_DELAY = 2.0 if platform.system() == 'Darwin' else 0.5
+    # Seconds our own synthetic keys are ignored by the trigger listener,
+    # plus TYPED_KEY_SETTLE per character sent by the typing backend, whose
+    # keys reach the listener one by one
+    PASTE_SETTLE_DELAY = 0.05
+    TYPED_KEY_SETTLE = 0.002
+    # Seconds without a key before a trigger that is also the start of a
+    # longer one (':tt' and ':tt30') fires on its own
+    PENDING_TRIGGER_TIMEOUT = 0.6
 
-class CalendarApp:
     def __init__(self):
-        self.settings_file = SETTINGS_FILE
-        self.cache_file = APP_DIR / 'calendar_cache.json'
-
-        # Load icon first
-        self.icon_image = self.load_icon()
-
-        # Log startup
-        logging.debug(f"App directory: {APP_DIR}")
-        logging.info(f"Settings file: {self.settings_file}")
-        logging.info(f"Cache file: {self.cache_file}")
-
         # Initialize threading objects
         self.paste_lock = threading.Lock()
         self.is_pasting = False
-
-        # Initialize trigger patterns as a list - the active one will be first
-        self.trigger_patterns = []
-
-        self.load_settings()
-
-        # Ensure trigger pattern is in the patterns list
-        if hasattr(self, 'trigger_pattern'):
-            self.trigger_patterns = [self.trigger_pattern.lower()]
-
-        self.cached_free_slots = None
-        self.load_cache()
+        # Guards the trigger matcher between the key listener and the
+        # pending trigger timer
+        self._matcher_lock = threading.Lock()
+        # Single-slot command queue of the paste worker, see request_paste()
+        self._paste_queue = queue.Queue(maxsize=1)
+        self._paste_thread = None
+
+        # Settings, cached calendars and free slots
+        super().__init__(SETTINGS_FILE, APP_DIR / 'calendar_cache.bin')
+        import_profile.mark("Cached free slots ready")
+        self.rebuild_trigger_matcher()
         self.settings_window = None
 
+        # Only now load the icon (and PIL)
+        self.icon_image = self.load_icon()
+
         # Initialize the root window
         self.root = tk.Tk()
         self.root.withdraw()
@@ -820,8 +776,6 @@ class CalendarApp:
         - Use 'pynput' on macOS
         """
         system = platform.system()
-        self.char_buffer = ""
-        self.buffer_max_size = 20
 
         # Ensure we have the paste lock
         if not hasattr(self, 'paste_lock'):
@@ -830,12 +784,17 @@ class CalendarApp:
         # Ensure we have trigger patterns list
         if not hasattr(self, 'trigger_patterns') or not self.trigger_patterns:
             self.trigger_patterns = [self.trigger_pattern.lower()]
+        self.rebuild_trigger_matcher()
 
         # Only start a new listener if we don't have one already
         if system == "Darwin" and (not hasattr(self, '_keyboard_listener') or not self._keyboard_listener):
             from pynput import keyboard as pynput_keyboard
 
             logging.info(f"Setting up hotkey monitor for macOS with trigger patterns: {self.trigger_patterns}")
+            Key = pynput_keyboard.Key
+            modifier_keys = {Key.shift, Key.shift_l, Key.shift_r, Key.ctrl, Key.ctrl_l, Key.ctrl_r,
+                             Key.alt, Key.alt_l, Key.alt_r, Key.alt_gr, Key.cmd, Key.cmd_l, Key.cmd_r,
+                             Key.caps_lock}
 
             def on_press(key):
                 # Only process keys if we're not currently pasting
@@ -843,35 +802,21 @@ class CalendarApp:
                     return
 
                 try:
-                    if hasattr(key, "char") and key.char is not None:
-                        c = key.char
-                        self.char_buffer += c
-                        if len(self.char_buffer) > self.buffer_max_size:
-                            self.char_buffer = self.char_buffer[-self.buffer_max_size:]
-                        logging.debug(f"Buffer now: {repr(self.char_buffer)}")
-
-                        # Check against all trigger patterns, with the active one first
-                        trigger_found = False
-                        for trigger in self.trigger_patterns:
-                            if trigger in self.char_buffer:
-                                logging.debug(f"Trigger '{trigger}' detected")
-                                trigger_found = True
-                                break
-
-                        if trigger_found:
-                            # Clear buffer immediately
-                            self.char_buffer = ""
-                            # Schedule trigger_paste with a small delay
-                            if hasattr(self, 'root') and self.root:
-                                self.root.after(10, self.trigger_paste)
-                            else:
-                                threading.Timer(0.01, self.trigger_paste).start()
-                    elif key == pynput_keyboard.Key.space:
-                        self.char_buffer += " "
-                    elif key == pynput_keyboard.Key.enter:
-                        self.char_buffer = ""
-                    elif key == pynput_keyboard.Key.backspace:
-                        self.char_buffer = self.char_buffer[:-1]
+                    # Matches all trigger patterns at once, one step per key
+                    with self._matcher_lock:
+                        matcher = self.trigger_matcher
+                        trigger = None
+                        if hasattr(key, "char") and key.char is not None:
+                            trigger = matcher.feed(key.char)
+                        elif key == pynput_keyboard.Key.space:
+                            trigger = matcher.feed(" ")
+                        elif key == pynput_keyboard.Key.backspace:
+                            matcher.backspace()
+                        elif key not in modifier_keys:
+                            # Enter, Tab, arrows, Esc...: the text around
+                            # the cursor is no longer what was typed
+                            matcher.reset()
+                    self._after_trigger_key(matcher, trigger)
                 except Exception as e:
                     logging.error(f"Error in on_press: {e}")
 
@@ -899,22 +844,21 @@ class CalendarApp:
                         if active_widget and isinstance(active_widget, (ttk.Entry, tk.Entry, ttk.Combobox)):
                             return
 
-                    if event.event_type == keyboard.KEY_DOWN and hasattr(event, 'name'):
-                        if event.name == 'space':
-                            self.char_buffer += ' '
-                        elif event.name == 'enter':
-                            self.char_buffer = ""
-                        elif event.name == 'backspace':
-                            self.char_buffer = self.char_buffer[:-1]
-                        elif len(event.name) == 1:
-                            self.char_buffer += event.name
-                        if len(self.char_buffer) > self.buffer_max_size:
-                            self.char_buffer = self.char_buffer[-self.buffer_max_size:]
-                        if self.trigger_pattern in self.char_buffer:
-                            for _ in range(len(self.trigger_pattern)):
-                                keyboard.send('backspace')
-                            self.char_buffer = ""
-                            self.trigger_paste()
+                    if event.event_type == keyboard.KEY_DOWN and event.name:
+                        with self._matcher_lock:
+                            matcher = self.trigger_matcher
+                            trigger = None
+                            if event.name == 'space':
+                                trigger = matcher.feed(' ')
+                            elif event.name == 'backspace':
+                                matcher.backspace()
+                            elif len(event.name) == 1:
+                                trigger = matcher.feed(event.name)
+                            elif not keyboard.is_modifier(event.name) and event.name != 'caps lock':
+                                # Enter, Tab, arrows, Esc...: the text around
+                                # the cursor is no longer what was typed
+                                matcher.reset()
+                        self._after_trigger_key(matcher, trigger)
 
                 keyboard.hook(on_key)
                 self._keyboard_listener = None  # not used for keyboard lib
@@ -923,74 +867,6 @@ class CalendarApp:
             except Exception as e:
                 logging.error(f"Failed to set up hotkey for Windows: {e}")
 
-    def _setup_mac_listener(self):
-        """
-        Set up the keyboard listener for macOS in a safe way
-        """
-        try:
-            from pynput import keyboard as pynput_keyboard
-
-            # Make sure we're using the most current trigger phrase
-            trigger = self.trigger_pattern.lower()
-            logging.info(f"Setting up hotkey monitor for macOS, trigger: {trigger!r}")
-
-            def on_press(key):
-                # Skip processing during paste operations
-                if hasattr(self, 'is_pasting') and self.is_pasting:
-                    return
-
-                try:
-                    if hasattr(key, "char") and key.char is not None:
-                        c = key.char
-                        self.char_buffer += c
-                        if len(self.char_buffer) > self.buffer_max_size:
-                            self.char_buffer = self.char_buffer[-self.buffer_max_size:]
-                        logging.debug(f"Buffer now: {repr(self.char_buffer)}")
-
-                        # Always check against the current trigger pattern
-                        current_trigger = self.trigger_pattern.lower()
-                        if current_trigger in self.char_buffer:
-                            logging.debug(f"Trigger '{current_trigger}' detected")
-                            # Clear buffer immediately
-                            self.char_buffer = ""
-                            # Schedule with a delay to make it thread-safe
-                            if hasattr(self, 'root') and self.root:
-                                self.root.after(10, self.trigger_paste)
-                            else:
-                                # Fallback if root is not available
-                                threading.Timer(0.01, self.trigger_paste).start()
-                    elif key == pynput_keyboard.Key.space:
-                        self.char_buffer += " "
-                    elif key == pynput_keyboard.Key.enter:
-                        self.char_buffer = ""
-                    elif key == pynput_keyboard.Key.backspace:
-                        self.char_buffer = self.char_buffer[:-1]
-                except Exception as e:
-                    logging.error(f"Error in on_press: {e}")
-
-            # Create a new listener with daemon=True to ensure it doesn't block application exit
-            listener = pynput_keyboard.Listener(
-                on_press=on_press,
-                daemon=True
-            )
-
-            # Start the listener
-            listener.start()
-            self._keyboard_listener = listener
-            logging.info("Keyboard listener started successfully for macOS")
-
-        except Exception as e:
-            logging.error(f"Failed to set up macOS keyboard listener: {e}")
-            self._keyboard_listener = None
-
-    def _delayed_setup_mac_listener(self):
-        """
-        Set up the Mac keyboard listener after a delay
-        """
-        logging.info("Running delayed listener setup")
-        self._recently_stopped_listener = False
-        self._setup_mac_listener()
-
     def _stop_all_keyboard_listeners(self):
         """
         Thoroughly clean up any existing keyboard listeners to prevent conflicts
@@ -1017,8 +893,99 @@ class CalendarApp:
         # Give a small delay to ensure cleanup completes
         time.sleep(0.1)
 
-    def trigger_paste(self):
-        """Method to handle trigger and paste operation"""
+    def _after_trigger_key(self, matcher, trigger):
+        """
+        Paste *trigger* if the key just fed completed one.  If the key
+        completed a trigger that is also the start of a longer one, fire it
+        after PENDING_TRIGGER_TIMEOUT unless another key comes first.
+        """
+        if trigger:
+            logging.debug(f"Trigger '{trigger}' detected")
+            self.request_paste(matcher.erase, trigger, time.perf_counter(), matcher.retype)
+        elif matcher.pending is not None:
+            timer = threading.Timer(self.PENDING_TRIGGER_TIMEOUT, self._fire_pending_trigger,
+                                    (matcher, matcher.typed))
+            timer.daemon = True
+            timer.start()
+
+    def _fire_pending_trigger(self, matcher, typed):
+        """Fire the held-back trigger if nothing was typed since it was completed"""
+        with self._matcher_lock:
+            if matcher is not self.trigger_matcher or matcher.typed != typed or self.is_pasting:
+                return
+            trigger = matcher.flush()
+        if trigger:
+            logging.debug(f"Trigger '{trigger}' detected after {self.PENDING_TRIGGER_TIMEOUT}s without a key")
+            self.request_paste(matcher.erase, trigger, time.perf_counter(), matcher.retype)
+
+    def rebuild_trigger_matcher(self):
+        """Compile the current trigger patterns and the trigger table into the keystroke matcher"""
+        self.trigger_matcher = TriggerMatcher(self.trigger_patterns + list(self.trigger_queries()))
+
+    def start_paste_worker(self):
+        """Start the thread that runs trigger_paste for the keyboard listeners"""
+        if self._paste_thread is not None and self._paste_thread.is_alive():
+            return
+        self._paste_thread = threading.Thread(target=self._paste_worker, name="paste-worker", daemon=True)
+        self._paste_thread.start()
+
+    def _paste_worker(self):
+        """Run queued paste requests one at a time until a None request arrives"""
+        # Load the automation modules here rather than on the first trigger
+        try:
+            with import_profile.timed('paste_engine'):
+                import paste_engine  # noqa: F401
+        except Exception as e:
+            logging.error(f"Could not load the paste modules: {e}")
+        while True:
+            request = self._paste_queue.get()
+            if request is None:
+                break
+            self.trigger_paste(*request)
+
+    def request_paste(self, erase, trigger, detected_at=None, retype=''):
+        """
+        Queue a paste for the paste worker and return at once, so the
+        keyboard listener and the Tk thread never wait on a paste.  A
+        trigger typed while one is already waiting is dropped.
+        """
+        self.start_paste_worker()
+        try:
+            self._paste_queue.put_nowait((erase, trigger, detected_at, retype))
+        except queue.Full:
+            logging.debug(f"Paste already queued, ignoring trigger '{trigger}'")
+
+    def revalidate_on_trigger(self):
+        """
+        Stale-while-revalidate for a trigger: start a background refresh
+        (conditional requests, so unchanged feeds cost a 304; failing feeds
+        keep their backoff), and if the cached slots are older than
+        ``max_cache_age`` or missing, wait up to ``trigger_refresh_deadline``
+        seconds for it before falling back to whatever is cached.
+        """
+        age = self.cache_age()
+        if not self._update_in_progress:
+            self.update_free_slots(force=False, revalidate=True)
+        if age is not None and age <= self.max_cache_age:
+            return
+
+        t0 = time.perf_counter()
+        if self._refresh_done.wait(self.trigger_refresh_deadline):
+            logging.info(f"Cache was {'empty' if age is None else f'{age:.0f}s old'}, "
+                         f"refreshed in {(time.perf_counter() - t0) * 1000:.0f} ms before pasting")
+        else:
+            logging.info(f"Refresh not done within {self.trigger_refresh_deadline}s, pasting cached slots")
+
+    def trigger_paste(self, erase=None, trigger=None, detected_at=None, retype=''):
+        """
+        Method to handle trigger and paste operation.  *erase* is the number
+        of typed characters to delete first (defaults to the trigger length)
+        and *trigger* the phrase that was typed, which picks the template.
+        *detected_at* is the perf_counter() time the trigger was recognised,
+        used to log the trigger-to-text latency.  *retype* is text typed
+        after the trigger that *erase* also deleted; it goes back after the
+        free slots (see TriggerMatcher.retype).
+        """
         # Make sure we have a paste lock
         if not hasattr(self, 'paste_lock'):
             self.paste_lock = threading.Lock()
@@ -1028,82 +995,42 @@ class CalendarApp:
             logging.debug("Another paste operation in progress, ignoring trigger")
             return
 
+        typed = 0
         try:
             # Set pasting flag to ignore keyboard events during paste
             self.is_pasting = True
             logging.debug("Starting paste operation with lock acquired")
 
-            if platform.system() == 'Darwin':
-                # First, delete the trigger text
-                for _ in range(len(self.trigger_pattern)):
-                    pyautogui.press('backspace')
-
-                # Small delay after backspace
-                time.sleep(0.05)
-
-                # Now perform the clipboard-based paste operation
-                if self.cached_free_slots:
-                    # Format the text
-                    formatted_text = self.format_free_slots(self.cached_free_slots)
+            # First, delete the trigger text
+            if erase is None:
+                erase = len(self.trigger_pattern)
+            import paste_engine
+            paste_engine.press_backspace(erase)
 
-                    # Store original clipboard content
-                    try:
-                        original_clip = pyperclip.paste()
-                        self.original_clipboard = original_clip
-                    except Exception as e:
-                        logging.error(f"Error saving clipboard: {e}")
-                        self.original_clipboard = None
-
-                    # Copy our text to clipboard
-                    pyperclip.copy(formatted_text)
-                    logging.debug("Text copied to clipboard")
-
-                    # Small delay to ensure clipboard is updated
-                    time.sleep(0.1)
+            # Revalidate on every trigger; only wait for it if the cache is stale
+            self.revalidate_on_trigger()
 
-                    # Paste using Command+V
-                    try:
-                        # Use proper key sequence with small delays
-                        pyautogui.keyDown('command')
-                        time.sleep(0.05)
-                        pyautogui.press('v')
-                        time.sleep(0.05)
-                        pyautogui.keyUp('command')
-                        logging.debug("Paste command sent")
-                    except Exception as e:
-                        logging.error(f"Error sending paste command: {e}")
-
-                    # Restore original clipboard after delay
-                    def restore_clip():
-                        if self.original_clipboard is not None:
-                            try:
-                                pyperclip.copy(self.original_clipboard)
-                                self.original_clipboard = None
-                                logging.debug("Original clipboard restored")
-                            except Exception as e:
-                                logging.error(f"Error restoring clipboard: {e}")
-
-                    # Use slightly longer delay for clipboard restoration
-                    threading.Timer(1.0, restore_clip).start()
-                else:
-                    logging.warning("No cached free slots available")
-            else:
-                # For Windows/Linux, use the original method
-                self.paste_free_slots()
+            # Then paste the pre-rendered text
+            typed = self.paste_free_slots(trigger, detected_at, retype)
 
         except Exception as e:
             logging.error(f"Error in trigger_paste: {e}", exc_info=True)
         finally:
-            # Reset paste flag after a delay
+            # Our own synthetic keys can still be on their way to the
+            # listener, so keep ignoring keys for a moment without holding
+            # up this thread
             def reset_pasting():
                 self.is_pasting = False
-                try:
-                    self.paste_lock.release()
-                    logging.debug("Paste lock released")
-                except Exception as e:
-                    logging.error(f"Error releasing paste lock: {e}")
+                if hasattr(self, 'trigger_matcher'):
+                    with self._matcher_lock:
+                        self.trigger_matcher.reset()
+                        # The re-typed keys can start the next trigger
+                        for ch in retype:
+                            self.trigger_matcher.feed(ch)
 
-            threading.Timer(0.5, reset_pasting).start()
+            self.paste_lock.release()
+            logging.debug("Paste lock released")
+            threading.Timer(self.PASTE_SETTLE_DELAY + typed * self.TYPED_KEY_SETTLE, reset_pasting).start()
 
     def debug_keyboard_state(self):
         """Debug helper to print current keyboard state"""
@@ -1117,160 +1044,12 @@ class CalendarApp:
         """Restore original clipboard content"""
         try:
             if self.original_clipboard is not None:
+                import pyperclip
                 pyperclip.copy(self.original_clipboard)
                 self.original_clipboard = None
         except Exception as e:
             logging.error(f"Error restoring clipboard: {e}")
 
-    def clear_cache(self):
-        """Clear all cached data"""
-        try:
-            if os.path.exists(self.cache_file):
-                os.remove(self.cache_file)
-            self.cached_free_slots = None
-            logging.info("Cache cleared successfully")
-        except Exception as e:
-            logging.error(f"Error clearing cache: {e}")
-
-    def load_settings(self):
-        """Load settings from file or use defaults"""
-        defaults = {
-            'calendar_urls': [],
-            'timezone': "Australia/Sydney",
-            'start_of_day': 9,
-            'end_of_day': 16,
-            'lookahead_days': 7,
-            'include_current_day': False,
-            'exclude_weekends': True,
-            'update_interval': 300,
-            'trigger_pattern': ":tt",
-            'custom_text': "I'm free at the following times...",
-            'ignore_all_day_events': True  # New setting, default to True
-        }
-
-        try:
-            logging.debug(f"Attempting to load settings from: {self.settings_file}")
-
-            if self.settings_file.exists():
-                with open(self.settings_file, 'r') as f:
-                    file_content = f.read()
-                    logging.debug(f"Settings file content: {file_content}")
-
-                    # Check if file is empty
-                    if not file_content.strip():
-                        logging.warning("Settings file exists but is empty. Using defaults.")
-                        settings = {}
-                    else:
-                        try:
-                            settings = json.loads(file_content)
-                        except json.JSONDecodeError as e:
-                            logging.error(f"Failed to parse settings JSON: {e}")
-                            settings = {}
-
-                    # Apply settings from file or use defaults
-                    for key, default_value in defaults.items():
-                        if key == 'timezone':
-                            timezone_str = settings.get(key, default_value)
-                            try:
-                                self.local_tz = pytz.timezone(timezone_str)
-                                logging.info(f"Loaded timezone: {timezone_str}")
-                            except Exception as e:
-                                logging.error(f"Invalid timezone {timezone_str}: {e}, using default")
-                                self.local_tz = pytz.timezone(default_value)
-                        else:
-                            value = settings.get(key, default_value)
-                            setattr(self, key, value)
-                            logging.debug(f"Loaded setting {key}: {value}")
-
-                    # For backward compatibility - map hotkey to trigger_pattern if needed
-                    if 'hotkey' in settings and not hasattr(self, 'trigger_pattern'):
-                        self.trigger_pattern = defaults['trigger_pattern']
-                        logging.info("Using default trigger pattern due to legacy settings format")
-
-                    logging.info("Settings loaded successfully from file")
-            else:
-                logging.info("Settings file not found, using defaults")
-                for key, value in defaults.items():
-                    if key == 'timezone':
-                        self.local_tz = pytz.timezone(value)
-                    else:
-                        setattr(self, key, value)
-                    logging.info(f"Setting default {key}: {value}")
-        except Exception as e:
-            logging.error(f"Error loading settings: {e}", exc_info=True)
-            logging.info("Using default settings due to error")
-            for key, value in defaults.items():
-                if key == 'timezone':
-                    self.local_tz = pytz.timezone(value)
-                else:
-                    setattr(self, key, value)
-
-    def save_settings(self):
-        """Save current settings to file"""
-        try:
-            settings = {
-                'calendar_urls': self.calendar_urls,
-                'timezone': str(self.local_tz),
-                'start_of_day': self.start_of_day,
-                'end_of_day': self.end_of_day,
-                'lookahead_days': self.lookahead_days,
-                'include_current_day': self.include_current_day,
-                'exclude_weekends': self.exclude_weekends,
-                'update_interval': self.update_interval,
-                'trigger_pattern': self.trigger_pattern,
-                'ignore_all_day_events': self.ignore_all_day_events,
-                'custom_text': self.custom_text
-            }
-
-            # Log what we're about to save
-            logging.info(f"Saving settings to: {self.settings_file}")
-            logging.info(f"Settings data: {settings}")
-
-            # Create directory if it doesn't exist
-            self.settings_file.parent.mkdir(parents=True, exist_ok=True)
-
-            with open(self.settings_file, 'w') as f:
-                json_data = json.dumps(settings, indent=2)
-                f.write(json_data)
-
-            logging.debug("Settings saved successfully")
-        except Exception as e:
-            logging.error(f"Error saving settings: {e}", exc_info=True)
-
-    def load_cache(self):
-        """Load cached free slots from temporary file"""
-        try:
-            if self.cache_file.exists():
-                with open(self.cache_file, 'r') as f:
-                    cached_data = json.load(f)
-                    # Convert string dates back to datetime objects
-                    self.cached_free_slots = {
-                        datetime.strptime(date_str, '%Y-%m-%d').date():
-                            [datetime.fromisoformat(slot_str) for slot_str in slots]
-                        for date_str, slots in cached_data.items()
-                    }
-            else:
-                self.cached_free_slots = {}
-        except Exception as e:
-            logging.error(f"Error loading cache: {e}")
-            self.cached_free_slots = {}
-
-    def save_cache(self):
-        """Save free slots to temporary file"""
-        try:
-            if self.cached_free_slots is None:
-                return
-
-            # Convert datetime objects to strings for JSON serialization
-            cache_data = {
-                date_obj.isoformat(): [slot.isoformat() for slot in slots]
-                for date_obj, slots in self.cached_free_slots.items()
-            }
-            with open(self.cache_file, 'w') as f:
-                json.dump(cache_data, f)
-        except Exception as e:
-            logging.error(f"Error saving cache: {e}")
-
     def show_settings(self):
         """Show the settings window with improved window handling for compiled app"""
         try:
@@ -1305,340 +1084,100 @@ class CalendarApp:
         except Exception as e:
             logging.error(f"Error showing settings window: {e}", exc_info=True)
 
-    def is_weekend(self, date_obj):
-        """Check if the given date is a weekend (Saturday=5 or Sunday=6)"""
-        return date_obj.weekday() >= 5
-
-    # This is a helper function. The only purpose of this is to allow easy debugging of busy times.
-    def format_busy_log(busy_dict: Dict[date, List[Tuple[datetime, datetime, str]]], start_date: date, lookahead_days: int, local_tz) -> str:
-        """Formats the busy dictionary for readable debug output. (Static Method)"""
-        log_lines = ["--- Busy Event Log ---"]
-        end_date = start_date + timedelta(days=lookahead_days - 1) # Calculate end date based on lookahead
-
-        # Get all relevant dates within the lookahead window
-        relevant_dates = sorted([d for d in busy_dict.keys() if start_date <= d <= end_date])
-
-        # Create a set of dates we actually have data for within the range
-        dates_with_data = set(relevant_dates)
-
-        # Iterate through each day in the lookahead range
-        for i in range(lookahead_days):
-            current_day = start_date + timedelta(days=i)
-            day_str = current_day.strftime("%Y-%m-%d %A")
-            log_lines.append(f"=== {day_str} ===")
-
-            if current_day in dates_with_data:
-                # Sort events by start time for the current day
-                sorted_events = sorted(busy_dict[current_day], key=lambda x: x[0])
-                if sorted_events:
-                    for start_time, end_time, summary in sorted_events:
-                        # Format start and end times
-                        start_f = start_time.astimezone(local_tz).strftime("%H:%M")
-                        end_f = end_time.astimezone(local_tz).strftime("%H:%M")
-
-                        # If the event spans across midnight into the next day, show the date too
-                        if end_time.astimezone(local_tz).date() > start_time.astimezone(local_tz).date():
-                             end_f = end_time.astimezone(local_tz).strftime("%Y-%m-%d %H:%M")
-
-                        log_lines.append(f"  - Busy: {start_f} to {end_f} | Event: {summary}")
-                else:
-                    log_lines.append("  No busy events recorded for this day.")
-            else:
-                log_lines.append("  No busy events recorded for this day.")
-
-        log_lines.append("--- End Busy Event Log ---")
-        return "\n".join(log_lines)
+    def current_paste_backend(self):
+        """The paste backend chosen for this platform, 'clipboard' unless set otherwise"""
+        import paste_engine
+        backend = self.paste_backend.get(platform.system(), 'clipboard')
+        if backend not in paste_engine.BACKENDS:
+            logging.warning(f"Unknown paste backend {backend!r}, using the clipboard")
+            backend = 'clipboard'
+        return backend
 
-    def fetch_and_parse_calendar(self, url: str) -> Dict[date, Set[datetime]]:
+    def paste_free_slots(self, trigger=None, detected_at=None, retype=''):
         """
-        Parse *url* and return {date: set(tz-aware datetime start-times)}
-        representing one-hour BUSY slots.  Handles RRULE/RDATE/EXDATE
-        across daylight-saving changes and eliminates UNTIL/DTSTART
-        timezone conflicts.
+        Paste free slots (for *trigger*'s template, if given), then *retype*,
+        via the clipboard or by typing them.  Returns the number of
+        characters typed as key events.
         """
-        t0 = time.time()
-        try:
-            gcal = Calendar.from_ical(requests.get(url, timeout=15).text)
-
-            today     = datetime.now(self.local_tz).date()
-            win_end   = today + timedelta(days=self.lookahead_days)
-            busy: Dict[date, List[Tuple[datetime, datetime, str]]] = {}
-
-            def _as_list(prop):
-                if prop is None:
-                    return []
-                return prop if isinstance(prop, list) else [prop]
-
-            for comp in gcal.walk():
-                if comp.name != "VEVENT":
-                    continue
-                if comp.get("status", "").upper() == "CANCELLED":
-                    continue          # cancelled master
-
-                summary  = str(comp.get("summary", "")) or "No title"
-
-                dt_start = comp.decoded("dtstart")
-                dt_end   = comp.decoded("dtend")
-
-                # all-day dates → midnight datetimes
-                if isinstance(dt_start, date) and not isinstance(dt_start, datetime):
-                    dt_start = datetime.combine(dt_start, datetime.min.time())
-                if isinstance(dt_end,   date) and not isinstance(dt_end,   datetime):
-                    dt_end   = datetime.combine(dt_end,   datetime.min.time())
-
-                # attach zone if absent
-                if dt_start.tzinfo is None:
-                    dt_start = self.local_tz.localize(dt_start)
-                if dt_end.tzinfo is None:
-                    dt_end   = self.local_tz.localize(dt_end)
-
-                dt_start = dt_start.astimezone(self.local_tz)
-                dt_end   = dt_end  .astimezone(self.local_tz)
-                duration = dt_end - dt_start
-
-                is_all_day = isinstance(comp.get("dtstart").dt, date) and \
-                             not isinstance(comp.get("dtstart").dt, datetime)
-                multi_day  = (dt_end.date() - dt_start.date()).days > 0
-                if (is_all_day or multi_day) and self.ignore_all_day_events:
-                    continue
-
-                # ───────────── overrides (RECURRENCE-ID) ─────────────
-                if comp.get("recurrence-id"):
-                    rid = comp.decoded("recurrence-id")
-                    if rid.tzinfo is None:
-                        rid = self.local_tz.localize(rid)
-                    rid = rid.astimezone(self.local_tz)
-
-                    # remove original instance
-                    for blk in busy.get(rid.date(), [])[:]:
-                        if abs((blk[0] - rid).total_seconds()) < 1:
-                            busy[rid.date()].remove(blk)
-                            break
-                    busy.setdefault(dt_start.date(), []).append((dt_start, dt_end, summary))
-                    continue
-
-                rrule_prop = comp.get("rrule")
-
-                # ───────────── recurring events ─────────────
-                if rrule_prop:
-                    from dateutil import rrule as dtr
-                    import pytz, re
-
-                    rrule_txt = rrule_prop.to_ical().decode("utf-8")
-
-                    # fix local UNTIL → UTC
-                    m = re.search(r"UNTIL=(\d{8}T\d{6})(Z?)", rrule_txt)
-                    if m and not m.group(2):
-                        until_local = datetime.strptime(m.group(1), "%Y%m%dT%H%M%S")
-                        until_local = self.local_tz.localize(until_local)
-                        until_utc   = until_local.astimezone(pytz.utc)
-                        rrule_txt   = (rrule_txt[:m.start(1)] +
-                                       until_utc.strftime("%Y%m%dT%H%M%SZ") +
-                                       rrule_txt[m.end(1):])
-
-                    rset = dtr.rruleset()
-                    # ignoretz=True ⇒ every value (DTSTART/UNTIL/BYxxx) treated naive
-                    rset.rrule(dtr.rrulestr(rrule_txt,
-                                            dtstart=dt_start.replace(tzinfo=None),
-                                            ignoretz=True))
-
-                    for rdate in _as_list(comp.get("rdate")):
-                        for rdt in rdate.dts:
-                            rset.rdate(rdt.dt.astimezone(self.local_tz).replace(tzinfo=None))
-                    for exdate in _as_list(comp.get("exdate")):
-                        for exdt in exdate.dts:
-                            rset.exdate(exdt.dt.astimezone(self.local_tz).replace(tzinfo=None))
-
-                    win_start_nv = datetime.combine(today, datetime.min.time())
-                    win_end_nv   = datetime.combine(win_end, datetime.max.time())
-
-                    for occ_nv in rset.between(win_start_nv, win_end_nv, inc=True):
-                        occ_start = self.local_tz.localize(occ_nv, is_dst=None)
-                        occ_end   = occ_start + duration
-                        busy.setdefault(occ_start.date(), []).append(
-                            (occ_start, occ_end, summary))
-                    continue
-
-                # ───────────── single / multi-day non-recurring ─────────────
-                if multi_day:
-                    ptr = dt_start.date()
-                    while ptr <= dt_end.date():
-                        blk_s = dt_start if ptr == dt_start.date() else \
-                                self.local_tz.localize(datetime.combine(ptr, datetime.min.time()))
-                        blk_e = dt_end   if ptr == dt_end.date()   else \
-                                self.local_tz.localize(datetime.combine(ptr, datetime.max.time()))
-                        busy.setdefault(ptr, []).append((blk_s, blk_e, summary))
-                        ptr += timedelta(days=1)
-                else:
-                    busy.setdefault(dt_start.date(), []).append((dt_start, dt_end, summary))
-
-            # Format and log the busy dictionary content for the relevant range
-            formatted_log = CalendarApp.format_busy_log(busy, today, self.lookahead_days, self.local_tz)
-            logging.debug(f"Processed busy blocks for URL {url}:\n{formatted_log}")
-
-            # ───────────── derive FREE one-hour slots ─────────────
-            free: Dict[date, Set[datetime]] = {}
-            for i in range(self.lookahead_days):
-                d = today + timedelta(days=i)
-                if self.exclude_weekends and self.is_weekend(d):
-                    continue
-                day_s = self.local_tz.localize(
-                    datetime.combine(d, datetime.min.time())).replace(hour=self.start_of_day)
-                day_e = self.local_tz.localize(
-                    datetime.combine(d, datetime.min.time())).replace(hour=self.end_of_day)
-
-                blocks = sorted(busy.get(d, []))
-                cur = day_s
-                while cur + timedelta(hours=1) <= day_e:
-                    slot_free = all(not (b_s < cur + timedelta(hours=1) and b_e > cur)
-                                    for b_s, b_e, _ in blocks)
-                    if slot_free:
-                        free.setdefault(d, set()).add(cur)
-                    cur += timedelta(hours=1)
-
-            logging.info("Calendar OK in %.2fs  %s", time.time() - t0, url)
-            return free
-
-        except Exception as exc:
-            logging.error("Calendar FAIL (%.2fs) %s – %s",
-                          time.time() - t0, url, exc, exc_info=True)
-            return {}
-
-    def find_common_free_slots(self):
-        """Finds common free slots across multiple calendars."""
-        start_time = time.time()
-        all_free_slots = []
-
-        for url in self.calendar_urls:
-            free_slots = self.fetch_and_parse_calendar(url)
-            all_free_slots.append(free_slots)
-
-        common_free_slots = {}
-        all_dates = set()
-        for calendar_slots in all_free_slots:
-            all_dates.update(calendar_slots.keys())
-
-        now = datetime.now(self.local_tz)
-        current_date = now.date()
-
-        for slot_date in all_dates:
-            # Skip current day if include_current_day is False
-            if not self.include_current_day and slot_date == current_date:
-                continue
-
-            date_slots = []
-            for calendar_slots in all_free_slots:
-                if slot_date in calendar_slots:
-                    date_slots.append(calendar_slots[slot_date])
-                else:
-                    break
-
-            if len(date_slots) == len(self.calendar_urls):
-                common_slots = set.intersection(*date_slots)
-                if common_slots:
-                    # For current day, filter out time slots that have already passed
-                    if slot_date == current_date:
-                        current_time = now.replace(minute=0, second=0, microsecond=0)
-                        common_slots = {slot for slot in common_slots if slot > current_time}
-
-                    if common_slots:  # Only add if there are slots remaining
-                        common_free_slots[slot_date] = sorted(list(common_slots))
-
-        elapsed_time = time.time() - start_time
-        logging.info(f"Total calendar update completed in {elapsed_time:.2f} seconds")
-        return common_free_slots
-
-    def format_free_slots(self, free_slots):
-        """Formats the free slots into the requested output format."""
-        def ordinal(n):
-            return f"{n}{'tsnrhtdd'[((n // 10 % 10 != 1) * (n % 10 < 4) * n % 10)::4]}"
-
-        formatted_output = [self.custom_text]
-        for date, slots in sorted(free_slots.items()):
-            day_str = date.strftime("%a") + f" {ordinal(date.day)}" + date.strftime(" %b")
-            slot_strs = [slot.strftime("%I%p").lstrip("0").lower() for slot in slots]
-            formatted_output.append(f"{day_str}: {', '.join(slot_strs)}")
-        return "\n".join(formatted_output)+ "\n\n"
-
-    def toggle_weekends(self):
-        """Toggle weekend exclusion and update free slots"""
-        self.exclude_weekends = not self.exclude_weekends
-        self.update_free_slots()
-
-    def paste_free_slots(self):
-        """Copy free slots to clipboard and simulate paste."""
         logging.debug("Paste free slots triggered")
+        import paste_engine
+        typed = 0
         try:
-            if self.cached_free_slots:
-                formatted_text = self.format_free_slots(self.cached_free_slots)
-
-                # Store original clipboard content
-                self.original_clipboard = pyperclip.paste()
-
-                # Copy our text
-                pyperclip.copy(formatted_text)
-                logging.debug("Text copied to clipboard")
-
-                # Use a longer delay before paste for macOS
-                time.sleep(0.5 if platform.system() == 'Darwin' else 0.1)
-
-                # Simulate paste - use a wrapper for pyautogui to improve reliability on macOS
-                if platform.system() == 'Darwin':  # macOS
-                    # Try paste multiple times with slight pauses to improve reliability
-                    for attempt in range(3):
+            formatted_text = self.text_for_trigger(trigger)
+            if not formatted_text and retype:
+                paste_engine.paste_text(retype, 'typing')
+                typed = len(retype)
+            if formatted_text:
+                backend = self.current_paste_backend()
+                saved = paste_engine.paste_text(formatted_text + retype, backend)
+                if backend == 'typing':
+                    typed = len(formatted_text + retype)
+                logging.debug(f"Text sent with the {backend} backend")
+
+                if detected_at is not None:
+                    latency = (time.perf_counter() - detected_at) * 1000
+                    logging.info(f"Expanded {trigger or self.trigger_pattern!r} in {latency:.1f} ms ({backend})")
+
+                if saved is not None:
+                    original_clipboard, count = saved
+                    self.original_clipboard = original_clipboard
+
+                    # The target app reads the clipboard when it handles the
+                    # shortcut, which we can't observe; restore in the
+                    # background unless something else was copied in between
+                    def restore_clip():
                         try:
-                            pyautogui.hotkey('command', 'v')
-                            logging.debug(f"Paste command sent (attempt {attempt + 1})")
-                            # If we got here without error, break the loop
-                            break
+                            if paste_engine.restore_clipboard(original_clipboard, count):
+                                logging.debug("Original clipboard restored")
                         except Exception as e:
-                            logging.error(f"Paste attempt {attempt + 1} failed: {e}")
-                            if attempt < 2:  # Don't sleep after last attempt
-                                time.sleep(0.2)
-                else:  # Windows/Linux
-                    pyautogui.hotkey('ctrl', 'v')
-                    logging.debug("Paste command sent")
-
-                # Restore original clipboard after a delay
-                delay = 0.5
-                if platform.system() == 'Darwin':
-                    delay = 2.0  # Use a longer delay for macOS
-                threading.Timer(delay, self.restore_clipboard).start()
+                            logging.error(f"Error restoring clipboard: {e}")
+                        if self.original_clipboard is original_clipboard:
+                            self.original_clipboard = None
+
+                    threading.Timer(self.CLIPBOARD_RESTORE_DELAY, restore_clip).start()
 
                 logging.debug("Paste operation completed")
             else:
                 logging.warning("No cached free slots available")
         except Exception as e:
             logging.error(f"Error pasting free slots: {e}", exc_info=True)
+        return typed
 
-    def update_free_slots(self):
-        """Update cached free slots."""
-        if hasattr(self, '_update_in_progress') and self._update_in_progress:
-            logging.info("Calendar update already in progress, skipping new update request")
-            return
-
-        def update_task():
+    def update_tooltip(self):
+        """
+        Show the age of the cached free slots in the tray icon tooltip.
+        Called from the refresh and scheduler threads, so the icon is only
+        touched on the Tk thread (pystray drives AppKit on macOS).
+        """
+        root = getattr(self, 'root', None)
+        if root is not None:
+            try:
+                root.after(0, self._set_tooltip)
+            except RuntimeError as e:
+                # Tk has already shut down
+                logging.debug(f"Could not update tooltip: {e}")
+
+    def _set_tooltip(self):
+        """Set the tooltip text, on the Tk thread"""
+        age = self.cache_age()
+        if age is None:
+            status = "no data yet"
+        elif age < 60:
+            status = "updated just now"
+        elif age < 3600:
+            status = f"updated {age // 60:.0f} min ago"
+        else:
+            status = f"updated {age // 3600:.0f} h ago"
+        if getattr(self, 'icon', None):
             try:
-                self._update_in_progress = True
-                logging.info("Starting calendar update...")
-                self.cached_free_slots = self.find_common_free_slots()
-                self.save_cache()
-                logging.debug("Calendar update completed successfully")
+                self.icon.title = f"FreeTime ({status})"
             except Exception as e:
-                logging.error(f"Error updating free slots: {e}")
-            finally:
-                self._update_in_progress = False
-
-        threading.Thread(target=update_task, daemon=True).start()
-
-    def update_loop(self):
-        """Background loop to update free slots periodically."""
-        while True:
-            self.update_free_slots()
-            time.sleep(self.update_interval)
+                logging.debug(f"Could not update tooltip: {e}")
 
     def load_icon(self):
         """Load icon from embedded resource or create default"""
+        with import_profile.timed('PIL'):
+            from PIL import Image
         try:
             # Try to load embedded icon
             icon_path = get_resource_path('icon.png')
@@ -1699,9 +1238,23 @@ class CalendarApp:
                 except Exception as e:
                     logging.error(f"Error stopping keyboard listener: {e}")
 
+            # Stop the paste worker
+            if getattr(self, '_paste_thread', None) is not None:
+                try:
+                    self._paste_queue.put_nowait(None)
+                except queue.Full:
+                    pass
+
+            # Close pooled HTTP connections and stop the parse workers
+            if hasattr(self, '_http_sessions'):
+                self._close_http_sessions()
+            if hasattr(self, '_process_pool'):
+                self._shutdown_process_pool()
+
             # Restore clipboard if needed
             if hasattr(self, 'original_clipboard') and self.original_clipboard is not None:
                 try:
+                    import pyperclip
                     pyperclip.copy(self.original_clipboard)
                     self.original_clipboard = None
                 except Exception as e:
@@ -1743,6 +1296,7 @@ class CalendarApp:
                 try:
                     # Force process termination as last resort
                     logging.info("Forcing process termination...")
+                    stop_log_listener()
                     import os
                     os._exit(0)  # Force immediate exit without cleanup
                 except Exception:
@@ -1792,8 +1346,12 @@ class CalendarApp:
             update_thread.start()
 
             # Setup the hotkey monitoring
+            self.start_paste_worker()
             self.setup_hotkey()
 
+            with import_profile.timed('pystray'):
+                import pystray
+
             # -------- pystray + tkinter MAIN LOOP HANDLING ---------
             system = platform.system()
             if system == "Darwin":
@@ -1815,6 +1373,8 @@ class CalendarApp:
                 )
                 # Start pystray in the main thread
                 self.icon.run_detached()  # non-blocking
+                import_profile.mark("Tray icon started")
+                import_profile.log_profile()
 
                 # Check if calendar URLs exist, if not show settings after a short delay
                 if not self.calendar_urls:
@@ -1844,6 +1404,8 @@ class CalendarApp:
                 # Start pystray in separate thread
                 icon_thread = threading.Thread(target=self.icon.run, daemon=True)
                 icon_thread.start()
+                import_profile.mark("Tray icon started")
+                import_profile.log_profile()
 
                 # Start tkinter mainloop
                 self.root.mainloop()
@@ -1855,6 +1417,10 @@ class CalendarApp:
 
 
 if __name__ == "__main__":
+    # Set up logging here rather than on import: spawned parse workers
+    # import this module too and must not start a second log writer
+    setup_logging(LOG_FILE)
+    atexit.register(stop_log_listener)
     try:
         logging.info("=" * 50)
         logging.info("FreeTime Application Session Start")
@@ -1874,6 +1440,7 @@ if __name__ == "__main__":
                         app.cleanup()
                     # Force exit for compiled Windows app
                     if getattr(sys, 'frozen', False):
+                        stop_log_listener()
                         import os
                         os._exit(0)
                 except Exception:
@@ -1895,6 +1462,7 @@ if __name__ == "__main__":
         # Final forced exit for Windows compiled app
         if platform.system() == "Windows" and getattr(sys, 'frozen', False):
             try:
+                stop_log_listener()
                 import os
 
                 os._exit(0)
@@ -0,0 +1,196 @@
+"""
+Versioned binary layout of calendar_cache.bin.
+
+    header   MAGIC, format VERSION, length and CRC32 of the body
+    body     zlib-compressed:
+             slot fingerprint, busy fingerprint, updated_at,
+             free slots      {date: [slot start]}
+             busy window     first and last day of the busy intervals
+             feeds           per URL: payload hash, ETag, Last-Modified, size,
+                             parse window, normalized events, busy intervals
+
+Datetimes are stored as UTC epoch seconds and dates as proleptic ordinals;
+the reader turns them back into datetimes in the given timezone.  Anything
+that doesn't match MAGIC, VERSION or the CRC raises CacheFormatError so the
+caller can discard the file.
+"""
+import json
+import math
+import struct
+import zlib
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+MAGIC = b'FTCACHE'
+VERSION = 1
+
+_HEADER = struct.Struct('<7sBII')
+_U32 = struct.Struct('<I')
+_I32 = struct.Struct('<i')
+_U64 = struct.Struct('<Q')
+_F64 = struct.Struct('<d')
+_NONE = 0xFFFFFFFF
+
+
+class CacheFormatError(ValueError):
+    """The cache file is not in a format this version can read"""
+
+
+class _Writer:
+    def __init__(self):
+        self.parts = []
+
+    def u32(self, value: int):
+        self.parts.append(_U32.pack(value))
+
+    def i32(self, value: int):
+        self.parts.append(_I32.pack(value))
+
+    def u64(self, value: int):
+        self.parts.append(_U64.pack(value))
+
+    def f64(self, value: Optional[float]):
+        self.parts.append(_F64.pack(math.nan if value is None else value))
+
+    def str(self, value: Optional[str]):
+        if value is None:
+            self.u32(_NONE)
+            return
+        data = value.encode('utf-8')
+        self.u32(len(data))
+        self.parts.append(data)
+
+    def times(self, values: List[datetime]):
+        self.u32(len(values))
+        self.parts.append(struct.pack(f'<{len(values)}q', *(int(v.timestamp()) for v in values)))
+
+    def dated(self, by_date: Dict[date, List[datetime]]):
+        self.u32(len(by_date))
+        for d, values in by_date.items():
+            self.i32(d.toordinal())
+            self.times(values)
+
+    def bytes(self) -> bytes:
+        return b''.join(self.parts)
+
+
+class _Reader:
+    def __init__(self, data: bytes, tz):
+        self.data = data
+        self.pos = 0
+        self.tz = tz
+
+    def _unpack(self, fmt: struct.Struct):
+        value, = fmt.unpack_from(self.data, self.pos)
+        self.pos += fmt.size
+        return value
+
+    def u32(self) -> int:
+        return self._unpack(_U32)
+
+    def i32(self) -> int:
+        return self._unpack(_I32)
+
+    def u64(self) -> int:
+        return self._unpack(_U64)
+
+    def f64(self) -> Optional[float]:
+        value = self._unpack(_F64)
+        return None if math.isnan(value) else value
+
+    def str(self) -> Optional[str]:
+        length = self.u32()
+        if length == _NONE:
+            return None
+        value = self.data[self.pos:self.pos + length].decode('utf-8')
+        self.pos += length
+        return value
+
+    def times(self) -> List[datetime]:
+        count = self.u32()
+        values = struct.unpack_from(f'<{count}q', self.data, self.pos)
+        self.pos += 8 * count
+        return [datetime.fromtimestamp(v, self.tz) for v in values]
+
+    def dated(self) -> Dict[date, List[datetime]]:
+        return {date.fromordinal(self.i32()): self.times() for _ in range(self.u32())}
+
+
+def _pairs(values: List[datetime]) -> List[Tuple[datetime, datetime]]:
+    return list(zip(values[::2], values[1::2]))
+
+
+def pack_cache(cache: dict) -> bytes:
+    """
+    Serialize *cache*, a dict with the keys slot_fingerprint,
+    busy_fingerprint, updated_at, free_slots, busy_window and feeds
+    ({url: feed entry with a 'busy' key, None for a failed feed}).
+    """
+    w = _Writer()
+    w.str(cache['slot_fingerprint'])
+    w.str(cache['busy_fingerprint'])
+    w.f64(cache['updated_at'])
+    w.dated(cache['free_slots'] or {})
+
+    busy_window = cache['busy_window']
+    w.i32(busy_window[0].toordinal() if busy_window else 0)
+    w.i32(busy_window[1].toordinal() if busy_window else 0)
+
+    feeds = cache['feeds']
+    w.u32(len(feeds))
+    for url, entry in feeds.items():
+        w.str(url)
+        w.str(entry['hash'])
+        w.str(entry.get('etag'))
+        w.str(entry.get('last_modified'))
+        w.u64(entry['size'])
+        w.i32(entry['window'][0].toordinal())
+        w.i32(entry['window'][1].toordinal())
+        w.str(json.dumps(entry['events'], separators=(',', ':')))
+        busy = entry.get('busy')
+        w.u32(0 if busy is None else 1)
+        if busy is not None:
+            w.dated({d: [t for interval in intervals for t in interval] for d, intervals in busy.items()})
+
+    body = zlib.compress(w.bytes(), 6)
+    return _HEADER.pack(MAGIC, VERSION, len(body), zlib.crc32(body)) + body
+
+
+def unpack_cache(data: bytes, tz) -> dict:
+    """Inverse of pack_cache(); datetimes come back in timezone *tz*"""
+    if len(data) < _HEADER.size:
+        raise CacheFormatError("truncated header")
+    magic, version, length, crc = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise CacheFormatError("not a FreeTime cache file")
+    if version != VERSION:
+        raise CacheFormatError(f"cache format version {version}, expected {VERSION}")
+    body = data[_HEADER.size:]
+    if len(body) != length or zlib.crc32(body) != crc:
+        raise CacheFormatError("corrupt cache body")
+
+    r = _Reader(zlib.decompress(body), tz)
+    cache = {
+        'slot_fingerprint': r.str(),
+        'busy_fingerprint': r.str(),
+        'updated_at': r.f64(),
+        'free_slots': r.dated(),
+    }
+    first, last = r.i32(), r.i32()
+    cache['busy_window'] = (date.fromordinal(first), date.fromordinal(last)) if first else None
+
+    feeds = {}
+    for _ in range(r.u32()):
+        url = r.str()
+        entry = {
+            'hash': r.str(),
+            'etag': r.str(),
+            'last_modified': r.str(),
+            'size': r.u64(),
+            'window': (date.fromordinal(r.i32()), date.fromordinal(r.i32())),
+            'events': json.loads(r.str()),
+        }
+        entry['busy'] = {d: _pairs(values) for d, values in r.dated().items()} if r.u32() else None
+        feeds[url] = entry
+    cache['feeds'] = feeds
+    return cache
@@ -0,0 +1,103 @@
+import argparse
+import json
+import logging
+import sys
+import time
+
+from freetime_engine import FreeTimeEngine, LOG_FILE, NotCoveredError, parse_minutes, setup_logging, stop_log_listener
+
+# Cache used when --urls names calendars that aren't configured, so a
+# one-off query doesn't replace the app's cache
+ADHOC_CACHE_NAME = 'cli_cache.bin'
+# Separate from the app's log: the GUI rotates its own file, which fails on
+# Windows while another process has it open
+CLI_LOG_FILE = LOG_FILE.with_name('freetime_cli.log')
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='freetime', description="Query FreeTime availability from the command line")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    query = commands.add_parser('query', help="print the common free slots",
+                                description="Print the common free slots. Options left out use the app settings.")
+    query.add_argument('--days', type=int, help="number of days to look ahead")
+    query.add_argument('--slot', type=parse_minutes, help="slot length, e.g. 30, 30m or 1h30m")
+    query.add_argument('--start', type=int, help="start of the working day (hour)")
+    query.add_argument('--end', type=int, help="end of the working day (hour)")
+    query.add_argument('--min-free', type=int, help="calendars that must be free (0 = all)")
+    query.add_argument('--weekends', action='store_true', default=None, help="include weekends")
+    query.add_argument('--today', action='store_true', default=None, help="include the current day")
+    query.add_argument('--urls', nargs='+', metavar='URL', help="calendar URLs instead of the configured ones")
+    query.add_argument('--format', choices=('text', 'json'), default='text')
+    query.add_argument('--max-age', type=float, metavar='SECONDS',
+                       help="answer from the cache if it is at most this old (default: max_cache_age setting)")
+    query.add_argument('--refresh', action='store_true', help="always download the calendars")
+    return parser
+
+
+def run_query(args) -> int:
+    engine = FreeTimeEngine()
+    if args.urls and not set(args.urls) <= set(engine.calendar_urls):
+        engine.calendar_urls = list(args.urls)
+        engine.cache_file = engine.cache_file.with_name(ADHOC_CACHE_NAME)
+        engine.load_cache()
+
+    overrides = {
+        'lookahead_days': args.days,
+        'slot_minutes': args.slot,
+        'start_of_day': args.start,
+        'end_of_day': args.end,
+        'min_free_calendars': args.min_free,
+        'exclude_weekends': False if args.weekends else None,
+        'include_current_day': args.today,
+        'calendars': args.urls
+    }
+    query = engine.make_query({key: value for key, value in overrides.items() if value is not None})
+    if query['slot_minutes'] <= 0 or query['lookahead_days'] <= 0:
+        print("freetime: --days and --slot must be positive", file=sys.stderr)
+        return 2
+    if not query['calendars']:
+        print("freetime: no calendar URLs configured, pass --urls", file=sys.stderr)
+        return 2
+
+    max_age = engine.max_cache_age if args.max_age is None else args.max_age
+    free_slots = None
+    if not args.refresh and engine.slots_updated_at is not None and time.time() - engine.slots_updated_at <= max_age:
+        try:
+            free_slots = engine.query_free_slots(query)
+            logging.info(f"CLI query answered from cache ({time.time() - engine.slots_updated_at:.0f}s old)")
+        except NotCoveredError:
+            pass
+
+    try:
+        if free_slots is None:
+            engine.min_horizon_days = query['lookahead_days']
+            engine.refresh()
+            if all(engine.feed_busy.get(url) is None for url in query['calendars']):
+                print("freetime: no calendar could be loaded, see the log for details", file=sys.stderr)
+                return 1
+            free_slots = engine.query_free_slots(query)
+    finally:
+        engine._close_http_sessions()
+        engine._shutdown_process_pool()
+
+    if args.format == 'json':
+        print(json.dumps(engine.free_slots_json(free_slots, query), indent=2))
+    else:
+        print(engine.format_free_slots(free_slots, query).rstrip('\n'))
+    return 0
+
+
+def main(argv=None) -> int:
+    """``freetime query ...``: print availability once and exit, without loading any GUI module"""
+    args = build_parser().parse_args(argv)
+    # Log to a file only; stdout is for the answer
+    setup_logging(CLI_LOG_FILE, console=False)
+    try:
+        return run_query(args)
+    finally:
+        stop_log_listener()
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,158 @@
+import argparse
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from freetime_engine import FreeTimeEngine, LOG_FILE, NotCoveredError, parse_minutes, setup_logging, stop_log_listener
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8787
+# Busy intervals are kept at least this many days ahead for queries
+DEFAULT_MAX_DAYS = 14
+
+
+def query_from_params(engine: FreeTimeEngine, params: dict) -> dict:
+    """
+    Build an engine query from request parameters: days, slot, start,
+    end, calendars (comma separated URLs or positions), min_free,
+    weekends and today.  Parameters left out use the app settings.
+    """
+    overrides = {}
+    if 'days' in params:
+        overrides['lookahead_days'] = int(params['days'])
+    if 'slot' in params:
+        overrides['slot_minutes'] = parse_minutes(params['slot'])
+    if 'start' in params:
+        overrides['start_of_day'] = int(params['start'])
+    if 'end' in params:
+        overrides['end_of_day'] = int(params['end'])
+    if 'min_free' in params:
+        overrides['min_free_calendars'] = int(params['min_free'])
+    if 'weekends' in params:
+        overrides['exclude_weekends'] = params['weekends'].lower() in ('0', 'false', 'no')
+    if 'today' in params:
+        overrides['include_current_day'] = params['today'].lower() in ('1', 'true', 'yes')
+    if params.get('calendars'):
+        overrides['calendars'] = [int(item) if item.isdigit() else item
+                                  for item in params['calendars'].split(',')]
+    query = engine.make_query(overrides)
+    if query['slot_minutes'] <= 0 or query['lookahead_days'] <= 0:
+        raise ValueError("days and slot must be positive")
+    if not 0 <= query['start_of_day'] < query['end_of_day'] <= 23:
+        raise ValueError("start and end must be hours from 0 to 23, with start before end")
+    unknown = [url for url in query['calendars'] if url not in engine.calendar_urls]
+    if unknown:
+        raise ValueError(f"Unknown calendars: {', '.join(unknown)}")
+    if query['lookahead_days'] > engine.horizon_days():
+        raise ValueError(f"days can be at most {engine.horizon_days()}, "
+                         f"restart the daemon with a larger --max-days to look further ahead")
+    return query
+
+
+class AvailabilityServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for bursts of concurrent clients before connections are refused
+    request_queue_size = 128
+
+
+class AvailabilityHandler(BaseHTTPRequestHandler):
+    """
+    GET /availability?days=5&slot=30m&calendars=0,2&format=json|text
+    GET /health
+
+    Answers come from the busy intervals the engine keeps in memory; no
+    request ever waits on the network.
+    """
+    server_version = "FreeTime"
+    engine: FreeTimeEngine = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path == '/health':
+                self._send(200, {
+                    'status': 'ok',
+                    'calendars': len(self.engine.calendar_urls),
+                    'age_seconds': self.engine.cache_age(),
+                    'refreshing': self.engine._update_in_progress
+                })
+            elif url.path == '/availability':
+                self._availability(params)
+            else:
+                self._send(404, {'error': f"Unknown path {url.path}"})
+        except (ValueError, IndexError) as e:
+            self._send(400, {'error': f"Bad query: {e}"})
+        except Exception as e:
+            logging.error(f"Error answering {self.path}: {e}", exc_info=True)
+            self._send(500, {'error': str(e)})
+
+    def _availability(self, params):
+        query = query_from_params(self.engine, params)
+        try:
+            free_slots = self.engine.query_free_slots(query)
+        except NotCoveredError as e:
+            # Calendars not loaded yet, or the settings just changed
+            self._send(503, {'error': str(e)})
+            return
+        if params.get('format') == 'text':
+            self._send(200, self.engine.format_free_slots(free_slots, query))
+        else:
+            self._send(200, self.engine.free_slots_json(free_slots, query))
+
+    def _send(self, status, body):
+        if isinstance(body, str):
+            data, content_type = body.encode('utf-8'), 'text/plain; charset=utf-8'
+        else:
+            data, content_type = json.dumps(body).encode('utf-8'), 'application/json'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+
+def main(argv=None):
+    """Run the refresh scheduler and serve availability on localhost until interrupted"""
+    parser = argparse.ArgumentParser(prog='Freetime.py --headless',
+                                     description="Serve FreeTime availability over local HTTP without a GUI")
+    parser.add_argument('--headless', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--max-days', type=int, default=DEFAULT_MAX_DAYS,
+                        help="days ahead that queries can ask for (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    setup_logging(LOG_FILE)
+    logging.info("=" * 50)
+    logging.info("FreeTime headless session start")
+
+    engine = FreeTimeEngine()
+    engine.min_horizon_days = args.max_days
+    AvailabilityHandler.engine = engine
+
+    threading.Thread(target=engine.update_loop, name="scheduler", daemon=True).start()
+
+    server = AvailabilityServer((args.host, args.port), AvailabilityHandler)
+    logging.info(f"Serving availability on http://{args.host}:{server.server_port}/availability")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Headless daemon stopped (KeyboardInterrupt)")
+    finally:
+        server.server_close()
+        if not engine._update_in_progress:
+            engine.save_cache()
+        engine._close_http_sessions()
+        engine._shutdown_process_pool()
+        stop_log_listener()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,1865 @@
+import re
+from datetime import datetime, timedelta, date
+import pytz
+import threading
+import time
+import random
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import tempfile
+import codecs
+import os
+import json
+import hashlib
+import heapq
+import bisect
+import logging
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+import queue
+import sys
+from pathlib import Path
+from typing import List, Dict, Tuple, TYPE_CHECKING
+from cache_format import pack_cache, unpack_cache
+from urllib.parse import urlsplit
+
+# Loaded on first use, see http_session and _download_calendar()
+if TYPE_CHECKING:
+    import requests
+    from icalendar import Calendar
+
+version_string = "0.99"
+# Changelog
+#1
+
+# v0.99 8/5/25
+# Working well across platforms
+
+# v091 1/5/25
+# Fix logging code so that it works across platforms
+
+# v09 25/4/25
+# fixed an error where recurring events created before daylight saving change are processed incorrectly after daylight savings.
+
+# v0.8 7/3/25
+# Added option to ignore allday and multi-day events
+
+# v0.7 3/3/25
+# Switched to text replacement rather than hotkey
+
+def get_app_directory():
+    """Get the directory where the app is running from"""
+    if getattr(sys, 'frozen', False):
+        # If the application is run as a bundle (compiled)
+        return Path(sys.executable).parent
+    else:
+        # If the application is run from a Python interpreter
+        return Path(__file__).parent
+
+def _ics_date(value: str):
+    """Return the date part of an iCal DATE / DATE-TIME value, or None if it can't be read"""
+    try:
+        return datetime.strptime(value.strip()[:8], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+def iter_ics_lines(chunks, encoding: str):
+    """
+    Decode the byte *chunks* of an ICS feed as they arrive and yield its
+    physical lines without line endings.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    pending = ''
+    for chunk in chunks:
+        lines = (pending + decoder.decode(chunk)).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending.rstrip('\r')
+
+def iter_ics_blocks(lines, win_start: date, win_end: date):
+    """
+    Stream over the lines of an ICS feed, unfolding them, and yield
+    ('line', line) for every line outside a VEVENT and ('event', lines) for
+    each complete VEVENT that could overlap win_start .. win_end, as soon
+    as its END:VEVENT has been read.
+
+    Events with RRULE, RDATE or RECURRENCE-ID are kept (unless the RRULE
+    ended before the window).  Dates are compared with a day of slack
+    either side so timezone offsets can't push a real overlap out.
+    Anything we can't read is kept, so the filter only ever drops events
+    the full parser would have thrown away anyway.
+    """
+    lo = win_start - timedelta(days=1)
+    hi = win_end + timedelta(days=1)
+    event: List[str] = []
+    in_event = False
+    kept = dropped = 0
+
+    def keep_event(props):
+        if 'RECURRENCE-ID' in props or 'RDATE' in props:
+            return True
+        if 'RRULE' in props:
+            m = re.search(r"UNTIL=(\d{8})", props['RRULE'])
+            until = _ics_date(m.group(1)) if m else None
+            return until is None or until >= lo
+        start = _ics_date(props['DTSTART']) if 'DTSTART' in props else None
+        if start is None or start > hi:
+            return start is None
+        if 'DTEND' in props:
+            end = _ics_date(props['DTEND'])
+            return end is None or end >= lo
+        # DURATION events may run past their start date, so keep them
+        return 'DURATION' in props or start >= lo
+
+    def flush(line):
+        """Return the block to yield once *line* completes one, else None"""
+        nonlocal in_event, kept, dropped
+        if not in_event:
+            return ('line', line)
+        event.append(line)
+        if line.upper() != 'END:VEVENT':
+            return None
+        props = {}
+        for ev_line in event:
+            name, sep, value = ev_line.partition(':')
+            if sep:
+                # drop parameters, e.g. DTSTART;TZID=Europe/London
+                props.setdefault(name.split(';', 1)[0].upper(), ev_line.rsplit(':', 1)[1])
+        block = None
+        if keep_event(props):
+            block = ('event', list(event))
+            kept += 1
+        else:
+            dropped += 1
+        event.clear()
+        in_event = False
+        return block
+
+    logical = None
+    for raw in lines:
+        if raw[:1] in (' ', '\t') and logical is not None:
+            # folded continuation of the previous line
+            logical += raw[1:]
+            continue
+        if logical is not None:
+            block = flush(logical)
+            if block is not None:
+                yield block
+        logical = raw
+        if not in_event and raw.upper() == 'BEGIN:VEVENT':
+            in_event = True
+            event.append(raw)
+            logical = None
+    if logical is not None:
+        block = flush(logical)
+        if block is not None:
+            yield block
+
+    logging.debug(f"ICS prefilter kept {kept} events, dropped {dropped} outside {lo} .. {hi}")
+
+_TZID_PARAM = re.compile(r';TZID=(?:"([^"]*)"|([^;:]*))', re.IGNORECASE)
+
+def _block_tzids(block: List[str]) -> set:
+    """The TZID parameters used in a VEVENT block"""
+    return {quoted or plain for line in block for quoted, plain in _TZID_PARAM.findall(line)}
+
+def parse_ics_events(header: List[str], blocks) -> List[dict]:
+    """
+    Parse VEVENT *blocks* (lists of unfolded lines) inside a calendar made
+    of *header*, the VCALENDAR properties and VTIMEZONEs, and return them
+    normalized (see normalize_calendar()).
+    """
+    from icalendar import Calendar
+    doc = header + [line for block in blocks for line in block] + ['END:VCALENDAR']
+    return normalize_calendar(Calendar.from_ical("\r\n".join(doc) + "\r\n"))
+
+class StreamingIcsParser:
+    """
+    Parses the blocks from iter_ics_blocks() as they arrive.  VCALENDAR
+    properties and VTIMEZONEs are kept as the header every batch is parsed
+    with; kept VEVENTs are parsed *batch_size* at a time.  Events whose
+    TZID has no VTIMEZONE yet, and all events when *eager* is False, are
+    held back for finish(), so they resolve exactly as in a one-shot parse.
+    """
+    def __init__(self, batch_size: int, eager: bool = True):
+        self.batch_size = batch_size
+        self.eager = eager
+        self.header: List[str] = []
+        self.tzids = set()
+        self.components: List[str] = []
+        self.batch: List[List[str]] = []
+        self.held: List[List[str]] = []
+        self.events: List[dict] = []
+        self.batches = 0
+        self.first_batch_at = None
+
+    def feed(self, kind: str, item):
+        if kind == 'line':
+            upper = item.upper()
+            if upper.startswith('BEGIN:'):
+                self.components.append(upper[6:])
+            in_timezone = self.components[1:2] == ['VTIMEZONE']
+            if self.components[:1] == ['VCALENDAR'] and (len(self.components) == 1 or in_timezone) \
+                    and upper != 'END:VCALENDAR':
+                self.header.append(item)
+                if in_timezone and len(self.components) == 2 and upper.startswith('TZID:'):
+                    self.tzids.add(item.split(':', 1)[1])
+            if upper.startswith('END:') and self.components:
+                self.components.pop()
+        elif self.eager and _block_tzids(item) <= self.tzids:
+            self.batch.append(item)
+            if len(self.batch) >= self.batch_size:
+                self.events.extend(parse_ics_events(self.header, self.batch))
+                self.batch = []
+                self.batches += 1
+                self.first_batch_at = self.first_batch_at or time.perf_counter()
+        else:
+            self.held.append(item)
+
+    def finish(self) -> List[dict]:
+        """Parse whatever is left and return all events"""
+        if self.header[:1] != ['BEGIN:VCALENDAR']:
+            raise ValueError("Response is not an iCalendar feed")
+        if self.batch or self.held:
+            self.events.extend(parse_ics_events(self.header, self.batch + self.held))
+            self.batch, self.held = [], []
+        return self.events
+
+def ical_value_to_str(value) -> str:
+    """Serialize a decoded iCal DATE / DATE-TIME (or the start of a PERIOD) for the event store"""
+    if isinstance(value, tuple):
+        value = value[0]
+    return value.isoformat()
+
+def ical_value_from_str(value: str):
+    """Inverse of ical_value_to_str(): 'YYYY-MM-DD' gives a date, anything else a datetime"""
+    if len(value) == 10:
+        return date.fromisoformat(value)
+    return datetime.fromisoformat(value)
+
+def normalize_calendar(gcal: 'Calendar') -> List[dict]:
+    """
+    Flatten the VEVENTs of a parsed Calendar into plain dicts holding only
+    what FreeTimeEngine.expand_events() needs.  Times are kept as ISO strings
+    in their original zone (or floating), so the list doesn't depend on any
+    user setting and can be stored as JSON.
+    """
+    def _as_list(prop):
+        if prop is None:
+            return []
+        return prop if isinstance(prop, list) else [prop]
+
+    def _dts(comp, name):
+        return [ical_value_to_str(item.dt) for prop in _as_list(comp.get(name)) for item in prop.dts]
+
+    events = []
+    for comp in gcal.walk("VEVENT"):
+        if "dtstart" not in comp:
+            continue
+        dt_start = comp.decoded("dtstart")
+        if "dtend" in comp:
+            dt_end = comp.decoded("dtend")
+        elif "duration" in comp:
+            dt_end = dt_start + comp.decoded("duration")
+        elif isinstance(dt_start, datetime):
+            dt_end = dt_start
+        else:
+            dt_end = dt_start + timedelta(days=1)
+
+        rrules = _as_list(comp.get("rrule"))
+        events.append({
+            'uid': str(comp.get("uid", "")),
+            'sequence': int(comp.get("sequence", 0)),
+            'status': str(comp.get("status", "")).upper(),
+            'summary': str(comp.get("summary", "")) or "No title",
+            'start': ical_value_to_str(dt_start),
+            'end': ical_value_to_str(dt_end),
+            'rrule': rrules[0].to_ical().decode("utf-8") if rrules else None,
+            'rdate': _dts(comp, "rdate"),
+            'exdate': _dts(comp, "exdate"),
+            'recurrence_id': ical_value_to_str(comp.decoded("recurrence-id"))
+                             if comp.get("recurrence-id") else None
+        })
+    return events
+
+def merge_intervals(intervals) -> List[Tuple[datetime, datetime]]:
+    """Sort (start, end) intervals and merge any that overlap or touch"""
+    merged: List[Tuple[datetime, datetime]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+def subtract_intervals(window_start: datetime, window_end: datetime, busy) -> List[Tuple[datetime, datetime]]:
+    """
+    Sweep over *busy* (sorted and merged, see merge_intervals()) and return
+    the free (start, end) intervals left inside window_start .. window_end.
+    """
+    free: List[Tuple[datetime, datetime]] = []
+    cur = window_start
+    for b_s, b_e in busy:
+        if b_e <= cur:
+            continue
+        if b_s >= window_end:
+            break
+        if b_s > cur:
+            free.append((cur, b_s))
+        cur = max(cur, b_e)
+    if cur < window_end:
+        free.append((cur, window_end))
+    return free
+
+def intersect_intervals(interval_lists, required: int) -> List[Tuple[datetime, datetime]]:
+    """
+    k-way sweep over per-calendar free intervals (each list sorted and
+    non-overlapping) returning the intervals where at least *required*
+    calendars are free.  Runs in O(n log k) for n intervals over k lists.
+    """
+    def boundaries(intervals):
+        for start, end in intervals:
+            yield start, 1
+            yield end, -1
+
+    # At equal times ends (-1) sort before starts (+1), so intervals that
+    # only touch don't produce an empty overlap
+    common: List[Tuple[datetime, datetime]] = []
+    free_count = 0
+    opened = None
+    for when, delta in heapq.merge(*(boundaries(intervals) for intervals in interval_lists)):
+        free_count += delta
+        if delta > 0 and free_count == required:
+            opened = when
+        elif delta < 0 and free_count == required - 1:
+            if when > opened:
+                common.append((opened, when))
+            opened = None
+    return common
+
+def cut_into_slots(free, slot_minutes: int, align_to: datetime) -> List[datetime]:
+    """
+    Cut free (start, end) intervals into whole slots of *slot_minutes* and
+    return the slot start times.  Slots sit on a grid of slot_minutes
+    counted from *align_to* (the start of the working day), so the same
+    slot means the same time on every calendar.
+    """
+    step = timedelta(minutes=slot_minutes)
+    slots: List[datetime] = []
+    for start, end in free:
+        # round start up onto the grid
+        cur = align_to + -((align_to - start) // step) * step
+        while cur + step <= end:
+            slots.append(cur)
+            cur += step
+    return slots
+
+def parse_minutes(value: str) -> int:
+    """'30', '30m', '1h' or '1h30m' → minutes"""
+    value = value.strip().lower()
+    if value.isdigit():
+        return int(value)
+    minutes = 0
+    number = ''
+    for ch in value:
+        if ch.isdigit():
+            number += ch
+        elif ch in 'hm' and number:
+            minutes += int(number) * (60 if ch == 'h' else 1)
+            number = ''
+        else:
+            raise ValueError(f"Invalid duration: {value!r}")
+    if number:
+        raise ValueError(f"Invalid duration: {value!r}")
+    return minutes
+
+class RingLogHandler(RotatingFileHandler):
+    """
+    Append-only, size-bounded log: the live segment rolls over at
+    MAX_BYTES and only BACKUP_COUNT older segments are kept, so writing a
+    record is O(1).  The newest-first view is built on demand by
+    read_log_newest_first().
+    """
+    MAX_BYTES = 256 * 1024
+    BACKUP_COUNT = 2
+
+    def __init__(self, filename):
+        super().__init__(filename, maxBytes=self.MAX_BYTES, backupCount=self.BACKUP_COUNT, encoding='utf-8')
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler that never blocks the logging thread: when the queue is
+    full the record is dropped and counted, and a warning with the number
+    of dropped records is queued once there is room again.
+    """
+    QUEUE_SIZE = 10000
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._reported_dropped = 0
+
+    def enqueue(self, record):
+        # Called with the handler lock held, so the counters are safe
+        try:
+            if self.dropped != self._reported_dropped:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'levelno': logging.WARNING,
+                    'levelname': 'WARNING',
+                    'msg': f"Log queue full, dropped {self.dropped - self._reported_dropped} records "
+                           f"({self.dropped} in total)"
+                }))
+                self._reported_dropped = self.dropped
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+# Every record starts with the asctime of the log format below
+_LOG_RECORD_START = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3} - ")
+
+def read_log_newest_first(log_file, max_entries=1000) -> str:
+    """
+    Read the log segments written by RingLogHandler and return the most
+    recent *max_entries* records, newest first.  Multi-line records
+    (tracebacks) are kept together.
+    """
+    records: List[str] = []
+    for i in range(RingLogHandler.BACKUP_COUNT + 1):
+        segment = Path(f"{log_file}.{i}") if i else Path(log_file)
+        if not segment.exists():
+            continue
+        segment_records: List[str] = []
+        with open(segment, 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                if segment_records and not _LOG_RECORD_START.match(line):
+                    segment_records[-1] += line
+                else:
+                    segment_records.append(line)
+        records.extend(reversed(segment_records))
+        if len(records) >= max_entries:
+            break
+    return "".join(records[:max_entries])
+
+_log_listener = None
+
+
+def setup_logging(log_file, level=logging.INFO, console=True):
+    """
+    Send log records through a bounded queue to a single background writer
+    thread (the ring log file, and stderr if *console*), so keyboard hooks
+    and worker threads never wait on disk.  Returns the QueueListener.
+    """
+    global _log_listener
+    log_queue = queue.Queue(maxsize=DroppingQueueHandler.QUEUE_SIZE)
+    log_queue_handler = DroppingQueueHandler(log_queue)
+    # The writers below add the timestamp; the queue handler only merges msg/args
+    log_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+
+    log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    log_writers = [RingLogHandler(log_file)] + ([logging.StreamHandler()] if console else [])
+    for handler in log_writers:
+        handler.setFormatter(log_formatter)
+    _log_listener = QueueListener(log_queue, *log_writers, respect_handler_level=True)
+    _log_listener.start()
+
+    logging.basicConfig(level=level, handlers=[log_queue_handler])
+    return _log_listener
+
+
+def stop_log_listener():
+    """Write out any queued log records and stop the writer thread. Safe to call more than once."""
+    try:
+        if _log_listener is not None and _log_listener._thread is not None:
+            _log_listener.stop()
+    except Exception:
+        pass
+
+# Set up app paths
+APP_DIR = get_app_directory()
+SETTINGS_FILE = APP_DIR / 'calendar_settings.json'
+LOG_FILE = APP_DIR / 'freetime.log'
+
+try:
+    # Test write permissions by touching the files
+    SETTINGS_FILE.touch(exist_ok=True)
+    LOG_FILE.touch(exist_ok=True)
+except PermissionError:
+    # If we can't write to the app directory, fall back to user's temp directory
+    temp_dir = Path(tempfile.gettempdir()) / 'CalendarApp'
+    temp_dir.mkdir(exist_ok=True)
+    SETTINGS_FILE = temp_dir / 'calendar_settings.json'
+    LOG_FILE = temp_dir / 'calendar_app.log'
+    logging.warning(f"Cannot write to app directory. Using temporary directory: {temp_dir}")
+
+class EventExpander:
+    """
+    Expands normalized events (see normalize_calendar()) into busy blocks
+    in ``local_tz``, with an LRU of compiled RRULE expansions.  Used by
+    FreeTimeEngine and, on their own, by the parse worker processes.
+    """
+    # Maximum number of recurring series kept in the RRULE expansion cache
+    RRULE_CACHE_SIZE = 512
+
+    def __init__(self, local_tz=pytz.utc, ignore_all_day_events=False):
+        self.local_tz = local_tz
+        self.ignore_all_day_events = ignore_all_day_events
+
+        # Compiled RRULE expansions, see _expand_rrule()
+        self._rrule_cache = OrderedDict()
+        self._rrule_lock = threading.Lock()
+        self._rrule_stats = {'hit': 0, 'extend': 0, 'miss': 0}
+
+    def _compile_rrule(self, ev: dict, dt_start: datetime):
+        """Build the dateutil rruleset for a recurring event starting at local *dt_start*"""
+        from dateutil import rrule as dtr
+
+        def _local_naive(value):
+            """Stored RDATE/EXDATE value → naive local datetime for dateutil"""
+            if not isinstance(value, datetime):
+                return datetime.combine(value, dt_start.time())
+            if value.tzinfo is None:
+                return value
+            return value.astimezone(self.local_tz).replace(tzinfo=None)
+
+        rrule_txt = ev['rrule']
+
+        # fix local UNTIL → UTC
+        m = re.search(r"UNTIL=(\d{8}T\d{6})(Z?)", rrule_txt)
+        if m and not m.group(2):
+            until_local = datetime.strptime(m.group(1), "%Y%m%dT%H%M%S")
+            until_local = self.local_tz.localize(until_local)
+            until_utc   = until_local.astimezone(pytz.utc)
+            rrule_txt   = (rrule_txt[:m.start(1)] +
+                           until_utc.strftime("%Y%m%dT%H%M%SZ") +
+                           rrule_txt[m.end(1):])
+
+        # cache=True keeps generated occurrences, so later between() calls
+        # on a cached set don't recompute the series from DTSTART
+        rset = dtr.rruleset(cache=True)
+        # ignoretz=True ⇒ every value (DTSTART/UNTIL/BYxxx) treated naive
+        rset.rrule(dtr.rrulestr(rrule_txt,
+                                dtstart=dt_start.replace(tzinfo=None),
+                                ignoretz=True))
+
+        for rdt in ev['rdate']:
+            rset.rdate(_local_naive(ical_value_from_str(rdt)))
+        for exdt in ev['exdate']:
+            rset.exdate(_local_naive(ical_value_from_str(exdt)))
+        return rset
+
+    def _expand_rrule(self, ev: dict, dt_start: datetime, win_start_nv: datetime, win_end_nv: datetime) -> List[datetime]:
+        """
+        Return the naive local occurrences of a recurring event between
+        win_start_nv and win_end_nv (inclusive).
+
+        Compiled rulesets and their expanded occurrences are memoized in an
+        LRU keyed by UID, SEQUENCE, the RRULE/RDATE/EXDATE text, DTSTART and
+        the timezone.  Each entry remembers the window it was expanded for:
+        a window inside it is answered from the stored occurrences, and a
+        window that has moved forward only expands the new tail.
+        """
+        key = (ev['uid'], ev['sequence'], str(self.local_tz), ev['start'], ev['rrule'],
+               tuple(ev['rdate']), tuple(ev['exdate']))
+
+        with self._rrule_lock:
+            entry = self._rrule_cache.get(key)
+            if entry is None:
+                self._rrule_stats['miss'] += 1
+                rset = self._compile_rrule(ev, dt_start)
+                entry = {'rset': rset, 'start': win_start_nv, 'end': win_end_nv,
+                         'occurrences': rset.between(win_start_nv, win_end_nv, inc=True)}
+                self._rrule_cache[key] = entry
+                if len(self._rrule_cache) > self.RRULE_CACHE_SIZE:
+                    self._rrule_cache.popitem(last=False)
+            else:
+                self._rrule_cache.move_to_end(key)
+                if entry['start'] <= win_start_nv and win_end_nv <= entry['end']:
+                    self._rrule_stats['hit'] += 1
+                elif entry['start'] <= win_start_nv <= entry['end']:
+                    # window moved forward: expand only the new tail
+                    self._rrule_stats['extend'] += 1
+                    tail = [occ for occ in entry['rset'].between(entry['end'], win_end_nv, inc=True)
+                            if occ > entry['end']]
+                    entry['occurrences'] = [occ for occ in entry['occurrences'] if occ >= win_start_nv] + tail
+                    entry['start'], entry['end'] = win_start_nv, win_end_nv
+                else:
+                    self._rrule_stats['miss'] += 1
+                    entry['occurrences'] = entry['rset'].between(win_start_nv, win_end_nv, inc=True)
+                    entry['start'], entry['end'] = win_start_nv, win_end_nv
+
+            occurrences = entry['occurrences']
+            lo = bisect.bisect_left(occurrences, win_start_nv)
+            hi = bisect.bisect_right(occurrences, win_end_nv)
+            return occurrences[lo:hi]
+
+    def _local_datetime(self, value: str) -> datetime:
+        """Stored DATE / DATE-TIME string → tz-aware datetime in the local timezone (dates at midnight)"""
+        dt = ical_value_from_str(value)
+        if not isinstance(dt, datetime):
+            dt = datetime.combine(dt, datetime.min.time())
+        if dt.tzinfo is None:
+            dt = self.local_tz.localize(dt)
+        return dt.astimezone(self.local_tz)
+
+    def expand_events(self, events: List[dict], today: date, win_end: date) -> Dict[date, List[Tuple[datetime, datetime, str]]]:
+        """
+        Turn normalized events into {date: [(start, end, summary)]} BUSY
+        blocks in the local timezone for today .. win_end.  Handles
+        RRULE/RDATE/EXDATE across daylight-saving changes and eliminates
+        UNTIL/DTSTART timezone conflicts.
+
+        RECURRENCE-ID overrides are applied in two passes so feed order
+        doesn't matter: overrides are first indexed by (UID, RECURRENCE-ID),
+        then each expanded master instance is looked up in that index and
+        skipped if an override (or a cancellation) replaces it.
+        """
+        busy: Dict[date, List[Tuple[datetime, datetime, str]]] = {}
+
+        def add_block(dt_start, dt_end, summary, multi_day):
+            if multi_day:
+                ptr = dt_start.date()
+                while ptr <= dt_end.date():
+                    blk_s = dt_start if ptr == dt_start.date() else \
+                            self.local_tz.localize(datetime.combine(ptr, datetime.min.time()))
+                    blk_e = dt_end   if ptr == dt_end.date()   else \
+                            self.local_tz.localize(datetime.combine(ptr, datetime.max.time()))
+                    busy.setdefault(ptr, []).append((blk_s, blk_e, summary))
+                    ptr += timedelta(days=1)
+            else:
+                busy.setdefault(dt_start.date(), []).append((dt_start, dt_end, summary))
+
+        def event_times(ev):
+            """Return (start, end, skip) for an event, skip being True for ignored all-day/multi-day events"""
+            dt_start = self._local_datetime(ev['start'])
+            dt_end   = self._local_datetime(ev['end'])
+            is_all_day = len(ev['start']) == 10
+            multi_day  = (dt_end.date() - dt_start.date()).days > 0
+            return dt_start, dt_end, multi_day, (is_all_day or multi_day) and self.ignore_all_day_events
+
+        # ───────────── pass 1: index overrides (RECURRENCE-ID) ─────────────
+        overrides: Dict[Tuple[str, datetime], dict] = {}
+        for ev in events:
+            if ev['recurrence_id']:
+                key = (ev['uid'], self._local_datetime(ev['recurrence_id']))
+                if key not in overrides or ev['sequence'] >= overrides[key]['sequence']:
+                    overrides[key] = ev
+
+        # ───────────── pass 2: masters ─────────────
+        for ev in events:
+            if ev['recurrence_id']:
+                continue
+            if ev['status'] == "CANCELLED":
+                continue          # cancelled master
+
+            dt_start, dt_end, multi_day, skip = event_times(ev)
+            if skip:
+                continue
+            duration = dt_end - dt_start
+
+            # ───────────── recurring events ─────────────
+            if ev['rrule']:
+                win_start_nv = datetime.combine(today, datetime.min.time())
+                win_end_nv   = datetime.combine(win_end, datetime.max.time())
+
+                for occ_nv in self._expand_rrule(ev, dt_start, win_start_nv, win_end_nv):
+                    occ_start = self.local_tz.localize(occ_nv, is_dst=None)
+                    if (ev['uid'], occ_start) in overrides:
+                        continue  # replaced by its override in pass 3
+                    add_block(occ_start, occ_start + duration, ev['summary'], False)
+                continue
+
+            # ───────────── single / multi-day non-recurring ─────────────
+            if (ev['uid'], dt_start) not in overrides:
+                add_block(dt_start, dt_end, ev['summary'], multi_day)
+
+        # ───────────── pass 3: overrides ─────────────
+        for ev in overrides.values():
+            if ev['status'] == "CANCELLED":
+                continue          # cancelled instance, the original is already dropped
+            dt_start, dt_end, multi_day, skip = event_times(ev)
+            if not skip:
+                add_block(dt_start, dt_end, ev['summary'], multi_day)
+
+        return busy
+
+
+class NotCoveredError(ValueError):
+    """The busy intervals in memory don't cover a query yet"""
+
+
+class FreeTimeEngine(EventExpander):
+    """
+    Calendar refresh, free-time computation and caching, without any GUI.
+    CalendarApp adds the tray icon, settings window and keyboard triggers
+    on top; the headless daemon serves it over HTTP.
+    """
+    # Extra days parsed past the lookahead window, so a cached parse stays
+    # usable on a 304 as the window moves forward day by day
+    PREFILTER_SLACK_DAYS = 7
+    # Download chunk size, and VEVENTs parsed per batch while a feed
+    # streams in, see _download_calendar()
+    STREAM_CHUNK_SIZE = 64 * 1024
+    PARSE_BATCH_EVENTS = 200
+    # Per-feed refresh scheduling, see _reschedule_feed().  An unchanged
+    # feed is polled up to MAX_INTERVAL_FACTOR times less often than
+    # update_interval; a failing one is retried after RETRY_BASE seconds,
+    # doubling up to RETRY_MAX
+    MAX_INTERVAL_FACTOR = 4
+    RETRY_BASE = 60
+    RETRY_MAX = 3600
+    SCHEDULE_JITTER = 0.1
+    # The scheduler checks for clock jumps (resume from sleep) this often,
+    # and refreshes everything when the wall clock ran ahead this much
+    CLOCK_CHECK_INTERVAL = 30
+    CLOCK_JUMP_THRESHOLD = 60
+
+    def __init__(self, settings_file=None, cache_file=None):
+        super().__init__()
+        self.settings_file = settings_file or SETTINGS_FILE
+        self.cache_file = cache_file or APP_DIR / 'calendar_cache.bin'
+
+        logging.debug(f"App directory: {APP_DIR}")
+        logging.info(f"Settings file: {self.settings_file}")
+        logging.info(f"Cache file: {self.cache_file}")
+
+        # Initialize trigger patterns as a list - the active one will be first
+        self.trigger_patterns = []
+
+        self.load_settings()
+
+        # Ensure trigger pattern is in the patterns list
+        if hasattr(self, 'trigger_pattern'):
+            self.trigger_patterns = [self.trigger_pattern.lower()]
+
+        # Busy intervals are computed at least this many days ahead, so
+        # ad-hoc queries (see query_free_slots()) can look further than the
+        # configured lookahead
+        self.min_horizon_days = 0
+
+        # Per-feed HTTP validators, payload hashes and normalized events
+        self._feed_cache = {}
+        self._feed_lock = threading.Lock()
+        self._bytes_saved = 0
+        self._feeds_changed = 0
+        self._http_sessions = {}
+        # Worker processes for large feeds, see _parse_in_process()
+        self._process_pool = None
+        self._process_pool_failed = False
+
+        # Per-feed refresh schedule and the scheduler's wake-up event
+        self._feed_schedule = {}
+        self._refresh_wake = threading.Event()
+        self._refresh_pending = False
+        self._update_in_progress = False
+        self._update_lock = threading.Lock()
+        # Set whenever no refresh is running, so callers can wait for one
+        self._refresh_done = threading.Event()
+        self._refresh_done.set()
+
+        # Busy intervals per calendar from the last refresh, the days they
+        # cover and the settings fingerprints they and the free slots were
+        # computed with (see busy_fingerprint() / slot_fingerprint())
+        self.feed_busy = {}
+        self.feed_busy_window = None
+        self._busy_fingerprint = None
+        self._slot_fingerprint = None
+
+        # Pre-rendered paste texts, see render_paste_texts().  The versions
+        # are bumped whenever the free slots or the settings change.
+        self._data_version = 0
+        self._settings_version = 0
+        self._rendered = ((-1, -1), {})
+
+        # Results of ad-hoc queries for the current versions, see query_free_slots()
+        self._query_results = ((-1, -1), {})
+
+        self.cached_free_slots = None
+        self.slots_updated_at = None
+        self.load_cache()
+        self.render_paste_texts()
+
+    def cache_age(self):
+        """Seconds since the free slots were last updated, or None if there are none"""
+        # An empty dict is a fully booked week, not missing data
+        if self.cached_free_slots is None or self.slots_updated_at is None:
+            return None
+        return max(0.0, time.time() - self.slots_updated_at)
+
+    def clear_cache(self):
+        """Clear all cached data"""
+        try:
+            if os.path.exists(self.cache_file):
+                os.remove(self.cache_file)
+            self.feed_busy = {}
+            self.feed_busy_window = None
+            self.cached_free_slots = None
+            self.slots_updated_at = None
+            self._data_version += 1
+            logging.info("Cache cleared successfully")
+        except Exception as e:
+            logging.error(f"Error clearing cache: {e}")
+
+    def load_settings(self):
+        """Load settings from file or use defaults"""
+        defaults = {
+            'calendar_urls': [],
+            'timezone': "Australia/Sydney",
+            'start_of_day': 9,
+            'end_of_day': 16,
+            'lookahead_days': 7,
+            'include_current_day': False,
+            'exclude_weekends': True,
+            'update_interval': 300,
+            'trigger_pattern': ":tt",
+            'custom_text': "I'm free at the following times...",
+            'ignore_all_day_events': True,  # New setting, default to True
+            'slot_minutes': 60,
+            'min_free_calendars': 0,
+            'triggers': [],
+            'fetch_workers': 4,
+            'refresh_deadline': 45,
+            'paste_backend': {},
+            'max_cache_age': 600,
+            'trigger_refresh_deadline': 1.5,
+            'parse_process_min_bytes': 2_000_000  # 0 parses every feed in threads
+        }
+
+        try:
+            logging.debug(f"Attempting to load settings from: {self.settings_file}")
+
+            if self.settings_file.exists():
+                with open(self.settings_file, 'r') as f:
+                    file_content = f.read()
+                    logging.debug(f"Settings file content: {file_content}")
+
+                    # Check if file is empty
+                    if not file_content.strip():
+                        logging.warning("Settings file exists but is empty. Using defaults.")
+                        settings = {}
+                    else:
+                        try:
+                            settings = json.loads(file_content)
+                        except json.JSONDecodeError as e:
+                            logging.error(f"Failed to parse settings JSON: {e}")
+                            settings = {}
+
+                    # Apply settings from file or use defaults
+                    for key, default_value in defaults.items():
+                        if key == 'timezone':
+                            timezone_str = settings.get(key, default_value)
+                            try:
+                                self.local_tz = pytz.timezone(timezone_str)
+                                logging.info(f"Loaded timezone: {timezone_str}")
+                            except Exception as e:
+                                logging.error(f"Invalid timezone {timezone_str}: {e}, using default")
+                                self.local_tz = pytz.timezone(default_value)
+                        else:
+                            value = settings.get(key, default_value)
+                            setattr(self, key, value)
+                            logging.debug(f"Loaded setting {key}: {value}")
+
+                    # For backward compatibility - map hotkey to trigger_pattern if needed
+                    if 'hotkey' in settings and not hasattr(self, 'trigger_pattern'):
+                        self.trigger_pattern = defaults['trigger_pattern']
+                        logging.info("Using default trigger pattern due to legacy settings format")
+
+                    logging.info("Settings loaded successfully from file")
+            else:
+                logging.info("Settings file not found, using defaults")
+                for key, value in defaults.items():
+                    if key == 'timezone':
+                        self.local_tz = pytz.timezone(value)
+                    else:
+                        setattr(self, key, value)
+                    logging.info(f"Setting default {key}: {value}")
+        except Exception as e:
+            logging.error(f"Error loading settings: {e}", exc_info=True)
+            logging.info("Using default settings due to error")
+            for key, value in defaults.items():
+                if key == 'timezone':
+                    self.local_tz = pytz.timezone(value)
+                else:
+                    setattr(self, key, value)
+
+    def save_settings(self):
+        """Save current settings to file"""
+        try:
+            settings = {
+                'calendar_urls': self.calendar_urls,
+                'timezone': str(self.local_tz),
+                'start_of_day': self.start_of_day,
+                'end_of_day': self.end_of_day,
+                'lookahead_days': self.lookahead_days,
+                'include_current_day': self.include_current_day,
+                'exclude_weekends': self.exclude_weekends,
+                'update_interval': self.update_interval,
+                'trigger_pattern': self.trigger_pattern,
+                'ignore_all_day_events': self.ignore_all_day_events,
+                'custom_text': self.custom_text,
+                'slot_minutes': self.slot_minutes,
+                'min_free_calendars': self.min_free_calendars,
+                'triggers': self.triggers,
+                'fetch_workers': self.fetch_workers,
+                'refresh_deadline': self.refresh_deadline,
+                'paste_backend': self.paste_backend,
+                'max_cache_age': self.max_cache_age,
+                'trigger_refresh_deadline': self.trigger_refresh_deadline,
+                'parse_process_min_bytes': self.parse_process_min_bytes
+            }
+
+            # Log what we're about to save
+            logging.info(f"Saving settings to: {self.settings_file}")
+            logging.info(f"Settings data: {settings}")
+
+            # Create directory if it doesn't exist
+            self.settings_file.parent.mkdir(parents=True, exist_ok=True)
+
+            with open(self.settings_file, 'w') as f:
+                json_data = json.dumps(settings, indent=2)
+                f.write(json_data)
+
+            logging.debug("Settings saved successfully")
+        except Exception as e:
+            logging.error(f"Error saving settings: {e}", exc_info=True)
+
+        # Don't serve free slots computed for different settings
+        self.revalidate_cached_slots()
+
+        # Paste texts depend on the settings (intro text, trigger table, ...)
+        self._settings_version += 1
+        self.render_paste_texts()
+
+    def busy_fingerprint(self) -> str:
+        """Fingerprint of the settings the per-feed busy intervals depend on"""
+        key = {'timezone': str(self.local_tz), 'ignore_all_day_events': self.ignore_all_day_events}
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+
+    def slot_fingerprint(self) -> str:
+        """Fingerprint of the settings the main trigger's free slots depend on"""
+        query = {k: v for k, v in self.default_query().items()
+                 if k not in ('phrase', 'custom_text', 'line_format', 'slot_format')}
+        query['busy'] = self.busy_fingerprint()
+        return hashlib.sha256(json.dumps(query, sort_keys=True).encode()).hexdigest()[:16]
+
+    def _busy_covers(self, query: dict) -> bool:
+        """True if the busy intervals in memory are valid for *query*'s days and the current settings"""
+        if not self.feed_busy or self.feed_busy_window is None:
+            return False
+        if self._busy_fingerprint != self.busy_fingerprint():
+            return False
+        if any(url not in self.feed_busy for url in query['calendars']):
+            return False
+        today = datetime.now(self.local_tz).date()
+        first, last = self.feed_busy_window
+        return first <= today and today + timedelta(days=query['lookahead_days']) <= last
+
+    def revalidate_cached_slots(self):
+        """
+        Check the cached free slots against the current settings.  After a
+        timezone or all-day change the busy intervals are expanded again
+        from the stored events.  Free slots computed for other settings are
+        rebuilt from the busy intervals when those are valid, and dropped
+        otherwise, so a stale result is never pasted.
+        """
+        if self._busy_fingerprint is not None and self._busy_fingerprint != self.busy_fingerprint():
+            self._reexpand_busy()
+
+        fingerprint = self.slot_fingerprint()
+        if self.cached_free_slots is None or self._slot_fingerprint == fingerprint:
+            return
+        query = self.default_query()
+        if self._busy_covers(query):
+            self.cached_free_slots = self.compute_free_slots(query)
+            logging.info("Rebuilt free slots for the current settings from cached busy intervals")
+        else:
+            self.cached_free_slots = {}
+            self.slots_updated_at = None
+            logging.info("Cached free slots don't match the current settings, discarding them")
+        self._slot_fingerprint = fingerprint
+        self._data_version += 1
+
+    def _reexpand_busy(self):
+        """
+        Expand every calendar's stored events again for the current timezone
+        and all-day setting.  The busy intervals are discarded if any
+        calendar that has them can't be expanded offline.
+        """
+        today = datetime.now(self.local_tz).date()
+        window = (today, today + timedelta(days=self.horizon_days()))
+        feed_busy = {}
+        for url, busy in self.feed_busy.items():
+            if busy is None and url not in self._feed_cache:
+                feed_busy[url] = None
+                continue
+            feed_busy[url] = self._expand_stored(url, window)
+            if feed_busy[url] is None:
+                logging.info(f"Timezone or all-day setting changed and {url} has no stored events "
+                             f"for {window[0]} .. {window[1]}, discarding cached busy intervals")
+                self.feed_busy = {}
+                self.feed_busy_window = None
+                self._busy_fingerprint = None
+                return
+        self.feed_busy = feed_busy
+        self.feed_busy_window = window
+        self._busy_fingerprint = self.busy_fingerprint()
+        logging.info(f"Timezone or all-day setting changed, expanded {len(feed_busy)} calendars again from stored events")
+
+    def load_cache(self):
+        """
+        Load the binary cache (see cache_format): the per-feed events and
+        HTTP validators, the busy intervals of the last refresh and the main
+        trigger's free slots.  Parts computed with other settings are
+        rebuilt offline or discarded, see revalidate_cached_slots().  State
+        loaded from another cache file before is dropped first, even when
+        this one is missing.
+        """
+        self.cached_free_slots = {}
+        self.slots_updated_at = None
+        self.feed_busy = {}
+        self.feed_busy_window = None
+        self._feed_cache = {}
+        self._busy_fingerprint = None
+        self._slot_fingerprint = None
+        try:
+            data = self.cache_file.read_bytes()
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logging.error(f"Error reading cache: {e}")
+            return
+
+        try:
+            cache = unpack_cache(data, self.local_tz)
+        except Exception as e:
+            logging.warning(f"Discarding unreadable cache {self.cache_file}: {e}")
+            return
+
+        self._feed_cache = {url: {k: v for k, v in entry.items() if k != 'busy'}
+                            for url, entry in cache['feeds'].items()}
+        self.feed_busy = {url: cache['feeds'][url]['busy'] for url in self.calendar_urls if url in cache['feeds']}
+        self.feed_busy_window = cache['busy_window']
+        self._busy_fingerprint = cache['busy_fingerprint']
+        self._slot_fingerprint = cache['slot_fingerprint']
+        self.cached_free_slots = cache['free_slots']
+        self.slots_updated_at = cache['updated_at']
+        logging.info(f"Loaded cache with {len(self._feed_cache)} calendars ({len(data)} bytes)")
+
+        self.revalidate_cached_slots()
+
+    def save_cache(self):
+        """Write the binary cache atomically (temporary file + os.replace)"""
+        try:
+            if self.cached_free_slots is None:
+                return
+
+            feeds = {url: dict(entry, busy=self.feed_busy.get(url))
+                     for url, entry in list(self._feed_cache.items())}
+            data = pack_cache({
+                'slot_fingerprint': self._slot_fingerprint,
+                'busy_fingerprint': self._busy_fingerprint,
+                'updated_at': self.slots_updated_at,
+                'free_slots': self.cached_free_slots,
+                'busy_window': self.feed_busy_window,
+                'feeds': feeds
+            })
+            # A temporary file of its own per write: the app, the daemon and
+            # the CLI can all be writing the same cache
+            fd, tmp_file = tempfile.mkstemp(prefix=self.cache_file.stem + '.', suffix='.tmp',
+                                            dir=self.cache_file.parent)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_file, self.cache_file)
+            except BaseException:
+                Path(tmp_file).unlink(missing_ok=True)
+                raise
+            logging.debug(f"Saved cache ({len(data)} bytes)")
+
+            # Remove the JSON caches of earlier versions
+            for legacy in ('calendar_cache.json', 'calendar_feeds.json'):
+                (self.cache_file.parent / legacy).unlink(missing_ok=True)
+        except Exception as e:
+            logging.error(f"Error saving cache: {e}")
+
+    def is_weekend(self, date_obj):
+        """Check if the given date is a weekend (Saturday=5 or Sunday=6)"""
+        return date_obj.weekday() >= 5
+
+    # This is a helper function. The only purpose of this is to allow easy debugging of busy times.
+    def format_busy_log(busy_dict: Dict[date, List[Tuple[datetime, datetime, str]]], start_date: date, lookahead_days: int, local_tz) -> str:
+        """Formats the busy dictionary for readable debug output. (Static Method)"""
+        log_lines = ["--- Busy Event Log ---"]
+        end_date = start_date + timedelta(days=lookahead_days - 1) # Calculate end date based on lookahead
+
+        # Get all relevant dates within the lookahead window
+        relevant_dates = sorted([d for d in busy_dict.keys() if start_date <= d <= end_date])
+
+        # Create a set of dates we actually have data for within the range
+        dates_with_data = set(relevant_dates)
+
+        # Iterate through each day in the lookahead range
+        for i in range(lookahead_days):
+            current_day = start_date + timedelta(days=i)
+            day_str = current_day.strftime("%Y-%m-%d %A")
+            log_lines.append(f"=== {day_str} ===")
+
+            if current_day in dates_with_data:
+                # Sort events by start time for the current day
+                sorted_events = sorted(busy_dict[current_day], key=lambda x: x[0])
+                if sorted_events:
+                    for start_time, end_time, summary in sorted_events:
+                        # Format start and end times
+                        start_f = start_time.astimezone(local_tz).strftime("%H:%M")
+                        end_f = end_time.astimezone(local_tz).strftime("%H:%M")
+
+                        # If the event spans across midnight into the next day, show the date too
+                        if end_time.astimezone(local_tz).date() > start_time.astimezone(local_tz).date():
+                             end_f = end_time.astimezone(local_tz).strftime("%Y-%m-%d %H:%M")
+
+                        log_lines.append(f"  - Busy: {start_f} to {end_f} | Event: {summary}")
+                else:
+                    log_lines.append("  No busy events recorded for this day.")
+            else:
+                log_lines.append("  No busy events recorded for this day.")
+
+        log_lines.append("--- End Busy Event Log ---")
+        return "\n".join(log_lines)
+
+    def _get_http_session(self, url: str) -> 'requests.Session':
+        """
+        Return the long-lived requests.Session for *url*'s host, creating it
+        on first use.  Keeping one session per host lets keep-alive
+        connections (and their TLS sessions) be reused between refreshes.
+        """
+        host = urlsplit(url).netloc.lower()
+        with self._feed_lock:
+            session = self._http_sessions.get(host)
+            if session is None:
+                from http_session import ACCEPT_ENCODING, new_session
+                session = new_session(max(1, int(self.fetch_workers)), f"FreeTime/{version_string}")
+                self._http_sessions[host] = session
+                logging.debug(f"Created HTTP session for {host} (Accept-Encoding: {ACCEPT_ENCODING})")
+            return session
+
+    def _close_http_sessions(self):
+        """Close all pooled HTTP sessions"""
+        with self._feed_lock:
+            sessions = list(self._http_sessions.values())
+            self._http_sessions.clear()
+        for session in sessions:
+            try:
+                session.close()
+            except Exception as e:
+                logging.error(f"Error closing HTTP session: {e}")
+
+    def _download_calendar(self, url: str, win_start: date, win_end: date):
+        """
+        Download *url* and return its normalized events (see
+        normalize_calendar()), revalidating against the ETag /
+        Last-Modified validators from the previous download.
+
+        The events are stored per URL under a hash of the ICS payload.  On
+        a 304 Not Modified, or when the payload hashes the same as last
+        time, the stored events are reused and the feed isn't parsed again.
+
+        The body is read in chunks and only VEVENTs that can overlap
+        win_start .. win_end (plus PREFILTER_SLACK_DAYS) are kept, see
+        iter_ics_blocks().  When the feed has likely changed (no usable
+        stored parse, or its last download changed too) those VEVENTs are
+        parsed in batches while the rest of the body is still arriving.
+        Otherwise the parse waits for the payload hash, which may show the
+        stored parse still holds.
+
+        Feeds of parse_process_min_bytes or more (by their last size, or
+        Content-Length) are read whole and parsed and expanded on a worker
+        process instead, see _parse_in_process().  Returns (events, merged
+        busy intervals for win_start .. win_end, or None when the caller
+        still has to expand the events).
+        """
+        stored = self._feed_cache.get(url)
+        # A stored parse is only reusable if it covers the current window
+        covers = (stored is not None and
+                  stored['window'][0] <= win_start and win_end <= stored['window'][1])
+        headers = {}
+        if covers:
+            if stored.get('etag'):
+                headers['If-None-Match'] = stored['etag']
+            if stored.get('last_modified'):
+                headers['If-Modified-Since'] = stored['last_modified']
+
+        from http_session import http_timings
+        http_timings.connect = 0.0
+        http_timings.tls = 0.0
+        t0 = time.perf_counter()
+        response = self._get_http_session(url).get(url, headers=headers, timeout=15, stream=True)
+        t_headers = time.perf_counter()
+        timings = (f"connect {http_timings.connect * 1000:.0f}ms, tls {http_timings.tls * 1000:.0f}ms, "
+                   f"wait {(t_headers - t0 - http_timings.connect - http_timings.tls) * 1000:.0f}ms")
+
+        if response.status_code == 304 and covers:
+            response.close()
+            logging.info(f"HTTP 304 {url}: {timings}")
+            with self._feed_lock:
+                self._bytes_saved += stored['size']
+            logging.debug(f"Calendar not modified, reusing stored events ({stored['size']} bytes saved): {url}")
+            self._reschedule_feed(url, 'unchanged', response.headers)
+            return stored['events'], None
+
+        response.raise_for_status()
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+        window = (win_start, win_end + timedelta(days=self.PREFILTER_SLACK_DAYS))
+        encoding = response.encoding or 'utf-8'
+        expected_size = stored['size'] if stored else int(response.headers.get('Content-Length') or 0)
+        offload = (bool(self.parse_process_min_bytes) and not self._process_pool_failed
+                   and expected_size >= self.parse_process_min_bytes)
+        hasher = hashlib.sha256()
+        size = 0
+
+        def chunks():
+            nonlocal size
+            for chunk in response.iter_content(self.STREAM_CHUNK_SIZE):
+                hasher.update(chunk)
+                size += len(chunk)
+                yield chunk
+
+        if offload:
+            # Parsed and expanded by a worker process, see _parse_in_process()
+            body = b''.join(chunks())
+        else:
+            # Some servers send validators but ignore them, so a 200 to a
+            # conditional request doesn't prove a change; go by whether the
+            # feed changed last time
+            eager = not covers or self._feed_schedule.get(url, {}).get('changed', False)
+            parser = StreamingIcsParser(self.PARSE_BATCH_EVENTS, eager=eager)
+            for kind, item in iter_ics_blocks(iter_ics_lines(chunks(), encoding), *window):
+                parser.feed(kind, item)
+        t_done = time.perf_counter()
+
+        logging.info(
+            f"HTTP {response.status_code} {url}: {timings}, "
+            f"transfer {(t_done - t_headers) * 1000:.0f}ms, "
+            f"{size} bytes (encoding: {response.headers.get('Content-Encoding', 'identity')})")
+
+        payload_hash = hasher.hexdigest()
+        if covers and payload_hash == stored['hash']:
+            logging.debug(f"Calendar payload unchanged, reusing {len(stored['events'])} stored events: {url}")
+            stored['etag'] = etag
+            stored['last_modified'] = last_modified
+            self._reschedule_feed(url, 'unchanged', response.headers)
+            return stored['events'], None
+
+        busy = None
+        if offload:
+            try:
+                events, busy = self._parse_in_process(url, body, encoding, window, win_start, win_end)
+            except BrokenProcessPool as e:
+                logging.warning(f"Parse worker processes unavailable ({e}), parsing in threads from now on")
+                self._process_pool_failed = True
+                self._shutdown_process_pool()
+                parser = StreamingIcsParser(self.PARSE_BATCH_EVENTS)
+                for kind, item in iter_ics_blocks(iter_ics_lines([body], encoding), *window):
+                    parser.feed(kind, item)
+                events = parser.finish()
+        else:
+            if parser.batches:
+                logging.debug(f"Parsed {parser.batches} batches while streaming, first after "
+                              f"{(parser.first_batch_at - t_headers) * 1000:.0f}ms; "
+                              f"{len(parser.batch) + len(parser.held)} events left: {url}")
+            events = parser.finish()
+
+        self._feed_cache[url] = {
+            'hash': payload_hash,
+            'etag': etag,
+            'last_modified': last_modified,
+            'size': size,
+            'window': window,
+            'events': events
+        }
+        self._reschedule_feed(url, 'changed', response.headers)
+        return events, busy
+
+    def _get_process_pool(self):
+        """The pool of parse worker processes, started on first use"""
+        with self._feed_lock:
+            if self._process_pool is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                workers = max(1, min(int(self.fetch_workers), os.cpu_count() or 1))
+                # spawn on every platform: forking a process that runs Tk
+                # and keyboard hooks isn't safe
+                self._process_pool = ProcessPoolExecutor(max_workers=workers,
+                                                         mp_context=multiprocessing.get_context('spawn'))
+                logging.info(f"Started a pool of {workers} parse worker processes")
+            return self._process_pool
+
+    def _shutdown_process_pool(self):
+        """Stop the parse worker processes, if any were started"""
+        with self._feed_lock:
+            pool, self._process_pool = self._process_pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _parse_in_process(self, url: str, body: bytes, encoding: str, window, win_start: date, win_end: date):
+        """
+        Prefilter, parse and expand a large feed on a worker process, so
+        big feeds use more than one core.  Returns (events, busy intervals
+        for win_start .. win_end); the intervals come back as one compact
+        integer array, see parse_worker.
+        """
+        from parse_worker import parse_and_expand, unpack_busy
+        t0 = time.perf_counter()
+        future = self._get_process_pool().submit(parse_and_expand, body, encoding, window, win_start, win_end,
+                                                 str(self.local_tz), self.ignore_all_day_events)
+        events, packed, worker_seconds = future.result()
+        busy = unpack_busy(packed, self.local_tz)
+        logging.info(f"Parsed {len(body)} bytes in a worker process: {worker_seconds * 1000:.0f}ms in the worker, "
+                     f"{(time.perf_counter() - t0) * 1000:.0f}ms round trip: {url}")
+        return events, busy
+
+    def _reschedule_feed(self, url: str, outcome: str, headers=None):
+        """
+        Set when *url* is next due for download after a fetch that was
+        'changed', 'unchanged' or 'failed'.  A changed feed goes back to
+        update_interval; each unchanged fetch stretches the interval by half,
+        up to MAX_INTERVAL_FACTOR × update_interval, and never below the
+        server's Cache-Control max-age.  Failures back off exponentially
+        from RETRY_BASE.  Every interval gets ±SCHEDULE_JITTER so feeds
+        don't all fall due at once.
+        """
+        base = max(1, self.update_interval)
+        longest = base * self.MAX_INTERVAL_FACTOR
+        with self._feed_lock:
+            entry = self._feed_schedule.setdefault(url, {'interval': base, 'failures': 0, 'next_due': 0.0})
+            if outcome == 'failed':
+                entry['failures'] += 1
+                delay = min(self.RETRY_BASE * 2 ** (entry['failures'] - 1), self.RETRY_MAX)
+            else:
+                entry['failures'] = 0
+                # Whether the last successful download changed the feed
+                entry['changed'] = outcome == 'changed'
+                if outcome == 'changed':
+                    self._feeds_changed += 1
+                    entry['interval'] = base
+                else:
+                    entry['interval'] = min(max(entry['interval'], base) * 1.5, longest)
+                delay = entry['interval']
+                cache_control = (headers or {}).get('Cache-Control', '')
+                m = re.search(r"max-age=(\d+)", cache_control)
+                if m and 'no-cache' not in cache_control:
+                    delay = max(delay, min(int(m.group(1)), longest))
+            delay *= 1 + random.uniform(-self.SCHEDULE_JITTER, self.SCHEDULE_JITTER)
+            entry['next_due'] = time.monotonic() + delay
+        logging.debug(f"Calendar {outcome}, next download in {delay:.0f}s: {url}")
+
+    def _feed_due(self, url: str) -> bool:
+        """True if *url* has never been downloaded or its next download is due"""
+        entry = self._feed_schedule.get(url)
+        return entry is None or entry['next_due'] <= time.monotonic()
+
+    def _feed_failing(self, url: str) -> bool:
+        """True if the last download of *url* failed, so it is backing off"""
+        entry = self._feed_schedule.get(url)
+        return entry is not None and entry['failures'] > 0
+
+    def seconds_until_due(self) -> float:
+        """Seconds until the next calendar falls due (0 if one is due now)"""
+        if not self.calendar_urls:
+            return float(self.update_interval)
+        now = time.monotonic()
+        due = [self._feed_schedule[url]['next_due'] if url in self._feed_schedule else now
+               for url in self.calendar_urls]
+        return max(0.0, min(due) - now)
+
+    def working_hours(self, d: date, query: dict) -> Tuple[datetime, datetime]:
+        """Return the (start, end) of the query's meeting-hours window on date *d*"""
+        midnight = datetime.combine(d, datetime.min.time())
+        day_s = self.local_tz.localize(midnight.replace(hour=query['start_of_day']))
+        day_e = self.local_tz.localize(midnight.replace(hour=query['end_of_day']))
+        return day_s, day_e
+
+    def default_query(self) -> dict:
+        """The availability query for the main trigger phrase, built from the app settings"""
+        return {
+            'phrase': self.trigger_pattern.lower(),
+            'lookahead_days': self.lookahead_days,
+            'slot_minutes': self.slot_minutes,
+            'start_of_day': self.start_of_day,
+            'end_of_day': self.end_of_day,
+            'calendars': list(self.calendar_urls),
+            'min_free_calendars': self.min_free_calendars,
+            'exclude_weekends': self.exclude_weekends,
+            'include_current_day': self.include_current_day,
+            'custom_text': self.custom_text,
+            'line_format': "{day}: {slots}",
+            'slot_format': "start"
+        }
+
+    def trigger_queries(self) -> Dict[str, dict]:
+        """
+        Resolve the ``triggers`` table into {phrase: query}.  Keys an entry
+        leaves out fall back to the app settings.  ``calendars`` may list
+        calendar URLs or 0-based positions in the calendar list.
+        """
+        queries = {}
+        for entry in self.triggers:
+            try:
+                query = self.make_query(entry)
+                query['phrase'] = str(entry['phrase']).lower()
+                queries[query['phrase']] = query
+            except Exception as e:
+                logging.error(f"Ignoring invalid trigger entry {entry}: {e}")
+        return queries
+
+    def make_query(self, overrides: dict) -> dict:
+        """
+        default_query() with the keys given in *overrides*; unknown keys are
+        ignored.  ``calendars`` may list calendar URLs or 0-based positions
+        in the calendar list.
+        """
+        query = self.default_query()
+        query.update({key: value for key, value in overrides.items() if key in query})
+        if overrides.get('calendars'):
+            query['calendars'] = [
+                self.calendar_urls[item] if isinstance(item, int) else item
+                for item in overrides['calendars']
+            ]
+        return query
+
+    def query_free_slots(self, query: dict) -> Dict[date, List[datetime]]:
+        """
+        compute_free_slots() for an ad-hoc *query*, answered from memory.
+        Results are kept until the data or settings version changes, so
+        repeated queries cost a dict lookup.  Raises NotCoveredError if the
+        busy intervals in memory don't cover the query.
+        """
+        version = (self._data_version, self._settings_version)
+        key = json.dumps(query, sort_keys=True)
+        results_version, results = self._query_results
+        if results_version != version:
+            results = {}
+            self._query_results = (version, results)
+        elif key in results:
+            return results[key]
+
+        if not self._busy_covers(query):
+            raise NotCoveredError("No busy intervals cover this query yet")
+        slots = self.compute_free_slots(query)
+        results[key] = slots
+        return slots
+
+    def fetch_and_parse_calendar(self, url: str, horizon_days: int, download: bool = True) -> Dict[date, List[Tuple[datetime, datetime]]]:
+        """
+        Parse *url* and return {date: [(start, end)]}, the merged BUSY
+        intervals for each of the next *horizon_days* days.  When the feed
+        is unchanged only the download and parse are skipped; expanding into
+        the current window always runs.  With *download* False the stored
+        events are expanded without contacting the server, if they cover the
+        window.  Returns None if the feed failed.
+        """
+        t0 = time.time()
+        try:
+            today     = datetime.now(self.local_tz).date()
+            win_end   = today + timedelta(days=horizon_days)
+
+            stored = self._feed_cache.get(url)
+            events = merged = None
+            if not download:
+                if stored is None:
+                    # Failing feed in backoff, wait until it is due again
+                    logging.debug(f"Calendar not due and nothing stored, skipping: {url}")
+                    return None
+                if stored['window'][0] <= today and win_end <= stored['window'][1]:
+                    events = stored['events']
+
+            try:
+                if events is None:
+                    events, merged = self._download_calendar(url, today, win_end)
+            except Exception as exc:
+                self._reschedule_feed(url, 'failed')
+                stored = self._feed_cache.get(url)
+                if stored is None:
+                    raise
+                logging.warning(f"Calendar download failed ({exc}), using {len(stored['events'])} stored events: {url}")
+                events = stored['events']
+
+            if merged is None:
+                busy = self.expand_events(events, today, win_end)
+
+                # Format and log the busy dictionary content for the relevant range
+                formatted_log = FreeTimeEngine.format_busy_log(busy, today, horizon_days, self.local_tz)
+                logging.debug(f"Processed busy blocks for URL {url}:\n{formatted_log}")
+
+                merged = {d: merge_intervals((b_s, b_e) for b_s, b_e, _ in blocks)
+                          for d, blocks in busy.items()}
+
+            logging.info("Calendar OK in %.2fs  %s", time.time() - t0, url)
+            return merged
+
+        except Exception as exc:
+            logging.error("Calendar FAIL (%.2fs) %s – %s",
+                          time.time() - t0, url, exc, exc_info=True)
+            return None
+
+    def fetch_all_calendars(self, force: bool = True,
+                            revalidate: bool = False) -> Dict[str, Dict[date, List[Tuple[datetime, datetime]]]]:
+        """
+        Fetch and parse every calendar URL concurrently on a bounded worker
+        pool and return {url: busy intervals} (see fetch_and_parse_calendar).
+        The window covers the longest lookahead of any trigger.  Unless
+        *force* is set, only feeds that are due (see _reschedule_feed()) are
+        downloaded; the others are expanded from their stored events.  With
+        *revalidate*, feeds that aren't due are revalidated too, except
+        failing ones that are backing off.  Feeds
+        that have not finished within ``refresh_deadline`` seconds keep
+        their busy intervals from the last refresh (or their stored events,
+        see _timed_out_busy()) and count as failed if they have neither.
+        """
+        if not self.calendar_urls:
+            return {}
+
+        # Drop stored events for calendars that have been removed
+        for url in list(self._feed_cache):
+            if url not in self.calendar_urls:
+                del self._feed_cache[url]
+        self._bytes_saved = 0
+        self._feeds_changed = 0
+        self._rrule_stats = {'hit': 0, 'extend': 0, 'miss': 0}
+
+        horizon_days = self.horizon_days()
+
+        due = {url: force or self._feed_due(url) or (revalidate and not self._feed_failing(url))
+               for url in self.calendar_urls}
+        logging.info(f"Downloading {sum(due.values())} of {len(due)} calendars")
+
+        today = datetime.now(self.local_tz).date()
+        window = (today, today + timedelta(days=horizon_days))
+        # While the busy intervals in memory match this refresh, each
+        # calendar is swapped in as soon as it finishes, see _publish_feed()
+        current = self.feed_busy_window == window and self._busy_fingerprint == self.busy_fingerprint()
+        publish = current and all(url in self.feed_busy for url in self.calendar_urls)
+
+        workers = max(1, min(int(self.fetch_workers), len(self.calendar_urls)))
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="feed")
+        futures = {executor.submit(self.fetch_and_parse_calendar, url, horizon_days, due[url]): url
+                   for url in self.calendar_urls}
+        done = set()
+        try:
+            for future in as_completed(futures, timeout=self.refresh_deadline):
+                done.add(future)
+                if publish and len(done) < len(futures):
+                    self._publish_feed(futures[future], future.result())
+        except FuturesTimeoutError:
+            pass
+        finally:
+            # Don't let a hung feed hold up the refresh past the deadline
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        timed_out = {futures[future]: self._timed_out_busy(futures[future], window, current)
+                     for future in set(futures) - done}
+
+        if self._bytes_saved:
+            logging.info(f"Conditional requests saved {self._bytes_saved} bytes this refresh")
+        logging.debug(f"RRULE cache: {self._rrule_stats['hit']} hits, {self._rrule_stats['extend']} extended, "
+                      f"{self._rrule_stats['miss']} expanded, {len(self._rrule_cache)} series cached")
+
+        self.feed_busy_window = window
+        self._busy_fingerprint = self.busy_fingerprint()
+
+        # Keep the results in calendar_urls order
+        return {url: future.result() if future in done else timed_out[url] for future, url in futures.items()}
+
+    def horizon_days(self) -> int:
+        """Days ahead each refresh covers: the longest lookahead of any trigger, and min_horizon_days"""
+        return max([self.lookahead_days, self.min_horizon_days] +
+                   [query['lookahead_days'] for query in self.trigger_queries().values()])
+
+    def _timed_out_busy(self, url: str, window, current: bool):
+        """
+        Busy intervals for a calendar that missed the refresh deadline: the
+        ones from the last refresh if they were computed for *window* with
+        the current settings (*current*), else its stored events expanded
+        into *window* (see _expand_stored()).  None (no free time, like a
+        failed feed) if neither exists; leaving the calendar out would show
+        its busy times as free.
+        """
+        previous = self.feed_busy.get(url) if current else None
+        if previous is not None:
+            logging.warning(f"Calendar timed out after {self.refresh_deadline}s, "
+                            f"keeping its busy times from the last refresh: {url}")
+            return previous
+        busy = self._expand_stored(url, window)
+        if busy is not None:
+            logging.warning(f"Calendar timed out after {self.refresh_deadline}s, using its stored events: {url}")
+            return busy
+        logging.warning(f"Calendar timed out after {self.refresh_deadline}s with nothing stored, "
+                        f"treating it as busy: {url}")
+        return None
+
+    def _expand_stored(self, url: str, window):
+        """
+        Merged busy intervals for *window* from the stored events of *url*,
+        without downloading; None if none are stored for a window that
+        covers it, or they can't be expanded.
+        """
+        stored = self._feed_cache.get(url)
+        if stored is None or not (stored['window'][0] <= window[0] and window[1] <= stored['window'][1]):
+            return None
+        try:
+            busy = self.expand_events(stored['events'], *window)
+        except Exception as e:
+            logging.error(f"Error expanding stored events of {url}: {e}", exc_info=True)
+            return None
+        return {d: merge_intervals((b_s, b_e) for b_s, b_e, _ in blocks) for d, blocks in busy.items()}
+
+    def _publish_feed(self, url: str, busy):
+        """
+        Swap one calendar's fresh busy intervals into feed_busy while the
+        others are still refreshing, and recompute the free slots and paste
+        texts, so a slow feed doesn't hold back what the fast ones changed.
+        The other calendars keep their busy intervals from the last refresh
+        until they finish.
+        """
+        feed_busy = dict(self.feed_busy)
+        feed_busy[url] = busy
+        self.feed_busy = feed_busy
+        self.cached_free_slots = self.compute_free_slots(self.default_query())
+        self._data_version += 1
+        self.render_paste_texts()
+        logging.debug(f"Published fresh busy intervals of {url}")
+
+    def compute_free_slots(self, query: dict):
+        """
+        Compute {date: [slot start times]} for *query* from the busy
+        intervals of the last refresh.  The free intervals of the query's
+        calendars are intersected with a k-way sweep (see
+        intersect_intervals()); with min_free_calendars set, a time counts
+        as free when at least that many calendars are free.  A calendar
+        that failed to load counts as having no free time.
+        """
+        feeds = [self.feed_busy.get(url) for url in query['calendars']]
+        if not feeds:
+            return {}
+
+        required = len(feeds)
+        if query['min_free_calendars'] > 0:
+            required = min(query['min_free_calendars'], required)
+
+        common_free_slots = {}
+        now = datetime.now(self.local_tz)
+        current_date = now.date()
+
+        for i in range(query['lookahead_days']):
+            slot_date = current_date + timedelta(days=i)
+            # Skip current day if include_current_day is False
+            if not query['include_current_day'] and slot_date == current_date:
+                continue
+            if query['exclude_weekends'] and self.is_weekend(slot_date):
+                continue
+
+            day_s, day_e = self.working_hours(slot_date, query)
+            free_lists = [subtract_intervals(day_s, day_e, busy.get(slot_date, [])) if busy is not None else []
+                          for busy in feeds]
+            common = intersect_intervals(free_lists, required)
+            slots = cut_into_slots(common, query['slot_minutes'], day_s)
+
+            # For current day, filter out time slots that have already passed
+            if slot_date == current_date:
+                slots = [slot for slot in slots if slot > now]
+
+            if slots:  # Only add if there are slots remaining
+                common_free_slots[slot_date] = slots
+
+        return common_free_slots
+
+    def find_common_free_slots(self, force=True, revalidate=False):
+        """Refresh the calendars (see fetch_all_calendars()) and return the common free slots for the main trigger."""
+        start_time = time.time()
+        self.feed_busy = self.fetch_all_calendars(force, revalidate)
+        if not self.feed_busy:
+            logging.warning("No calendars returned results")
+            return {}
+
+        common_free_slots = self.compute_free_slots(self.default_query())
+        self._slot_fingerprint = self.slot_fingerprint()
+
+        elapsed_time = time.time() - start_time
+        logging.info(f"Total calendar update completed in {elapsed_time:.2f} seconds")
+        return common_free_slots
+
+    def render_paste_texts(self):
+        """
+        Pre-render the paste text of the main trigger and of every entry in
+        the trigger table, so a trigger only has to look its text up.  The
+        result is stamped with the data and settings versions it was built
+        from and swapped in with a single assignment.
+        """
+        version = (self._data_version, self._settings_version)
+        texts = {}
+        if self.cached_free_slots:
+            texts[self.trigger_pattern.lower()] = self.format_free_slots(self.cached_free_slots)
+        # Table entries need the busy intervals of a refresh in this session
+        if self.feed_busy:
+            for phrase, query in self.trigger_queries().items():
+                try:
+                    texts[phrase] = self.format_free_slots(self.compute_free_slots(query), query)
+                except Exception as e:
+                    logging.error(f"Error rendering trigger '{phrase}': {e}", exc_info=True)
+        self._rendered = (version, texts)
+        logging.debug(f"Rendered paste text for {len(texts)} triggers (version {version})")
+
+    def text_for_trigger(self, trigger=None):
+        """
+        Return the pre-rendered text to paste for *trigger* (the main trigger
+        if None), or None if there is nothing to paste yet.  Text from an
+        older data or settings version is rendered again first.
+        """
+        version, texts = self._rendered
+        if version != (self._data_version, self._settings_version):
+            logging.debug("Paste text out of date, rendering now")
+            self.render_paste_texts()
+            version, texts = self._rendered
+
+        main_trigger = self.trigger_pattern.lower()
+        text = texts.get(trigger if trigger is not None else main_trigger)
+        if text is None and trigger in self.trigger_patterns:
+            # the previous trigger while a changed one takes over
+            text = texts.get(main_trigger)
+        return text
+
+    def format_free_slots(self, free_slots, query=None):
+        """
+        Formats the free slots into the requested output format.  A trigger
+        *query* can override the intro text (custom_text), the per-day line
+        (line_format, with {day} and {slots}) and whether slots are shown as
+        start times or ranges (slot_format "start" / "range").
+        """
+        if query is None:
+            query = self.default_query()
+
+        def ordinal(n):
+            return f"{n}{'tsnrhtdd'[((n // 10 % 10 != 1) * (n % 10 < 4) * n % 10)::4]}"
+
+        def time_str(t):
+            return t.strftime("%I:%M%p" if t.minute else "%I%p").lstrip("0").lower()
+
+        slot_length = timedelta(minutes=query['slot_minutes'])
+        formatted_output = [query['custom_text']]
+        for date, slots in sorted(free_slots.items()):
+            day_str = date.strftime("%a") + f" {ordinal(date.day)}" + date.strftime(" %b")
+            if query['slot_format'] == "range":
+                slot_strs = [f"{time_str(slot)}-{time_str(slot + slot_length)}" for slot in slots]
+            else:
+                slot_strs = [time_str(slot) for slot in slots]
+            formatted_output.append(query['line_format'].format(day=day_str, slots=', '.join(slot_strs)))
+        return "\n".join(formatted_output)+ "\n\n"
+
+    def free_slots_json(self, free_slots, query) -> dict:
+        """*free_slots* for *query* as a JSON-serializable dict, with the age of the data"""
+        return {
+            'updated_at': self.slots_updated_at,
+            'age_seconds': self.cache_age(),
+            'slot_minutes': query['slot_minutes'],
+            'days': [
+                {'date': day.isoformat(), 'slots': [slot.isoformat() for slot in slots]}
+                for day, slots in sorted(free_slots.items())
+            ]
+        }
+
+    def toggle_weekends(self):
+        """Toggle weekend exclusion and update free slots"""
+        self.exclude_weekends = not self.exclude_weekends
+        self.update_free_slots()
+
+    def refresh(self, force=True, revalidate=False):
+        """
+        Refresh the calendars in the calling thread, then update the paste
+        texts and the cache.  A revalidation that found every feed unchanged
+        leaves the cache file alone.
+        """
+        logging.info("Starting calendar update...")
+        self.cached_free_slots = self.find_common_free_slots(force, revalidate)
+        self.slots_updated_at = time.time()
+        self._data_version += 1
+        self.render_paste_texts()
+        if revalidate and not self._feeds_changed:
+            logging.debug("No calendar changed, cache file not rewritten")
+        else:
+            self.save_cache()
+        logging.debug("Calendar update completed successfully")
+
+    def update_free_slots(self, force=True, revalidate=False):
+        """
+        Update cached free slots.  Manual updates (Update Now, settings
+        changes) download every calendar; the scheduler passes force=False
+        to download only the calendars that are due.  Triggers pass
+        force=False, revalidate=True to check every calendar with a
+        conditional request without retrying failing ones early.
+        """
+        with self._update_lock:
+            if self._update_in_progress:
+                if force:
+                    # Run again as soon as the current update finishes
+                    logging.info("Calendar update already in progress, queueing another one")
+                    self._refresh_pending = True
+                    self._refresh_wake.set()
+                else:
+                    logging.info("Calendar update already in progress, skipping new update request")
+                return
+            # Marked busy before the thread starts, so a caller can wait on it
+            self._update_in_progress = True
+            self._refresh_done.clear()
+
+        def update_task():
+            try:
+                self.refresh(force, revalidate)
+            except Exception as e:
+                logging.error(f"Error updating free slots: {e}")
+            finally:
+                self._update_in_progress = False
+                self._refresh_done.set()
+                self.update_tooltip()
+                # Let the scheduler pick up updates requested meanwhile
+                if self._refresh_pending:
+                    self._refresh_wake.set()
+
+        threading.Thread(target=update_task, daemon=True).start()
+
+    def update_tooltip(self):
+        """Hook for frontends to show the cache age; called after every refresh and scheduler tick"""
+
+    def update_loop(self):
+        """
+        Background scheduler.  Sleeps until the next calendar is due (see
+        _reschedule_feed()) and refreshes just the due ones.  It wakes early
+        for queued manual updates, and refreshes everything after a resume
+        from sleep, detected as the wall clock running ahead of the
+        monotonic clock.
+        """
+        self.update_free_slots()
+        last_wall, last_mono = time.time(), time.monotonic()
+        while True:
+            # At least a second, so a refresh in progress isn't polled in a busy loop
+            self._refresh_wake.wait(max(1.0, min(self.seconds_until_due(), self.CLOCK_CHECK_INTERVAL)))
+            self._refresh_wake.clear()
+
+            wall, mono = time.time(), time.monotonic()
+            jump = (wall - last_wall) - (mono - last_mono)
+            last_wall, last_mono = wall, mono
+            self.update_tooltip()
+
+            if self._update_in_progress:
+                continue
+            if jump > self.CLOCK_JUMP_THRESHOLD:
+                logging.info(f"Clock jumped {jump:.0f}s ahead (resumed from sleep?), refreshing all calendars")
+                self.update_free_slots()
+            elif self._refresh_pending:
+                self._refresh_pending = False
+                self.update_free_slots()
+            elif self.seconds_until_due() <= 0:
+                self.update_free_slots(force=False)
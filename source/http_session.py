@@ -0,0 +1,106 @@
+"""
+requests sessions for calendar downloads: connection pooling per host,
+retries with backoff, compressed transfers and connect/TLS timings.
+
+Kept out of freetime_engine so that importing the engine (the CLI, a
+cached answer) doesn't load requests and urllib3.
+"""
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+# urllib3 only decodes brotli responses when a brotli package is installed,
+# so only advertise it when we can actually read it
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "br, gzip, deflate"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = "br, gzip, deflate"
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
+
+# Connection timings for the request currently running on this thread
+http_timings = threading.local()
+
+# Longest wait honoured from a Retry-After header, so a server can't hold a
+# download (and the process waiting on it) for minutes
+MAX_RETRY_AFTER = 10
+
+
+class _CappedRetry(Retry):
+    """Retry that waits at most MAX_RETRY_AFTER seconds for a Retry-After header"""
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, MAX_RETRY_AFTER)
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    """HTTP connection that records how long the TCP connect took"""
+    def _new_conn(self):
+        t0 = time.perf_counter()
+        sock = super()._new_conn()
+        http_timings.connect = time.perf_counter() - t0
+        return sock
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    """HTTPS connection that records TCP connect and TLS handshake times separately"""
+    def _new_conn(self):
+        t0 = time.perf_counter()
+        sock = super()._new_conn()
+        http_timings.connect = time.perf_counter() - t0
+        return sock
+
+    def connect(self):
+        t0 = time.perf_counter()
+        super().connect()
+        http_timings.tls = max(0.0, time.perf_counter() - t0 - http_timings.connect)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools record connect/TLS timings in http_timings"""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool
+        }
+
+
+def new_session(pool_maxsize: int, user_agent: str) -> requests.Session:
+    """A requests.Session with timed, retrying connection pools of *pool_maxsize* connections per host"""
+    retries = _CappedRetry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True
+    )
+    adapter = TimedHTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_maxsize,
+        max_retries=retries
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({
+        'Accept-Encoding': ACCEPT_ENCODING,
+        'User-Agent': user_agent
+    })
+    return session
@@ -0,0 +1,59 @@
+"""
+Startup and import timing, written to the log in the spirit of
+``python -X importtime``.
+
+Heavy modules are imported on first use inside ``with timed(name):``,
+which records how long the import took and how many modules it pulled
+in.  mark() records startup milestones.  log_profile() writes everything
+recorded so far; imports timed after that are logged as they happen.
+"""
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Import this module first so START is close to process start
+START = time.perf_counter()
+
+_lock = threading.Lock()
+_imports = []   # (name, seconds, modules loaded, thread name)
+_marks = []     # (label, seconds since START)
+_logged = False
+
+
+@contextmanager
+def timed(name: str):
+    """Time the import statements in the block; nothing is recorded if they were already loaded"""
+    before = len(sys.modules)
+    t0 = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - t0
+    loaded = len(sys.modules) - before
+    if loaded <= 0:
+        return
+    with _lock:
+        _imports.append((name, elapsed, loaded, threading.current_thread().name))
+        logged = _logged
+    if logged:
+        logging.info(f"Imported {name} in {elapsed * 1000:.1f} ms ({loaded} modules)")
+
+
+def mark(label: str):
+    """Record a startup milestone at the current time"""
+    with _lock:
+        _marks.append((label, time.perf_counter() - START))
+
+
+def log_profile():
+    """Write the recorded imports (slowest first) and milestones to the log"""
+    global _logged
+    with _lock:
+        imports = sorted(_imports, key=lambda record: record[1], reverse=True)
+        marks = list(_marks)
+        _logged = True
+    lines = ["Startup profile (ms since start):"]
+    lines += [f"  {seconds * 1000:8.1f}  {label}" for label, seconds in marks]
+    lines.append("Imports (ms, modules loaded, thread):")
+    lines += [f"  {seconds * 1000:8.1f}  {loaded:4d}  {name} [{thread}]" for name, seconds, loaded, thread in imports]
+    logging.info("\n".join(lines))
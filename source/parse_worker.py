@@ -0,0 +1,68 @@
+"""
+Feed parsing on worker processes, for feeds too large to parse in a
+thread without holding the GIL for seconds (see
+FreeTimeEngine._parse_in_process()).
+
+The main process downloads; the worker prefilters, parses and expands
+the body and sends back the normalized events (for the feed cache) and
+the merged busy intervals packed into one flat array of epoch seconds,
+which pickles far smaller and faster than lists of aware datetimes.
+"""
+import time
+from array import array
+from datetime import date, datetime
+
+import pytz
+
+from freetime_engine import EventExpander, StreamingIcsParser, iter_ics_blocks, iter_ics_lines, merge_intervals
+
+# One expander per (timezone, ignore all-day) so the RRULE cache survives
+# between feeds handled by the same worker
+_expanders = {}
+
+
+def pack_busy(merged: dict) -> array:
+    """{date: [(start, end)]} -> [ordinal, count, start, end, ..., ordinal, count, ...] as int64"""
+    packed = array('q')
+    for day, intervals in merged.items():
+        packed.append(day.toordinal())
+        packed.append(len(intervals))
+        for start, end in intervals:
+            packed.append(int(start.timestamp()))
+            packed.append(int(end.timestamp()))
+    return packed
+
+
+def unpack_busy(packed: array, tz) -> dict:
+    """Inverse of pack_busy(), with the intervals in *tz*"""
+    merged = {}
+    i = 0
+    while i < len(packed):
+        day, count = date.fromordinal(packed[i]), packed[i + 1]
+        i += 2
+        merged[day] = [(datetime.fromtimestamp(packed[j], tz), datetime.fromtimestamp(packed[j + 1], tz))
+                       for j in range(i, i + 2 * count, 2)]
+        i += 2 * count
+    return merged
+
+
+def parse_and_expand(body: bytes, encoding: str, window, today: date, win_end: date,
+                     tz_name: str, ignore_all_day_events: bool):
+    """
+    Parse one ICS payload and expand it into today .. win_end.  Returns
+    (events, packed busy intervals, seconds spent in the worker).
+    """
+    t0 = time.perf_counter()
+    expander = _expanders.get((tz_name, ignore_all_day_events))
+    if expander is None:
+        expander = EventExpander(pytz.timezone(tz_name), ignore_all_day_events)
+        _expanders[(tz_name, ignore_all_day_events)] = expander
+
+    parser = StreamingIcsParser(batch_size=0, eager=False)
+    for kind, item in iter_ics_blocks(iter_ics_lines([body], encoding), *window):
+        parser.feed(kind, item)
+    events = parser.finish()
+
+    busy = expander.expand_events(events, today, win_end)
+    merged = {d: merge_intervals((b_s, b_e) for b_s, b_e, _ in blocks) for d, blocks in busy.items()}
+    return events, pack_busy(merged), time.perf_counter() - t0
@@ -0,0 +1,220 @@
+import logging
+import platform
+import time
+from typing import Iterator, List, Optional
+
+import pyautogui
+import pyperclip
+
+# How long to wait for the clipboard to take new contents before giving up
+CLIPBOARD_TIMEOUT = 0.5
+# Poll interval while waiting for the clipboard
+CLIPBOARD_POLL = 0.002
+
+# Ways of getting the text into the focused app, see paste_text()
+BACKENDS = ('clipboard', 'typing')
+# CGEventKeyboardSetUnicodeString only takes up to 20 UTF-16 units per event
+MAC_CHUNK_UNITS = 20
+
+
+def clipboard_change_count() -> Optional[int]:
+    """
+    The OS clipboard change counter (GetClipboardSequenceNumber on Windows,
+    NSPasteboard.changeCount on macOS), or None where there is none.
+    """
+    system = platform.system()
+    try:
+        if system == "Windows":
+            import ctypes
+            return ctypes.windll.user32.GetClipboardSequenceNumber()
+        if system == "Darwin":
+            from AppKit import NSPasteboard
+            return NSPasteboard.generalPasteboard().changeCount()
+    except Exception as e:
+        logging.debug(f"Clipboard change count unavailable: {e}")
+    return None
+
+
+def copy_and_confirm(text: str, timeout: float = CLIPBOARD_TIMEOUT) -> Optional[int]:
+    """
+    Put *text* on the clipboard and wait until the OS reports the change,
+    instead of sleeping a fixed time.  Returns the change count after the
+    copy (None if the platform has no counter), so a later restore can tell
+    whether anything else has been copied since.
+    """
+    before = clipboard_change_count()
+    pyperclip.copy(text)
+    deadline = time.perf_counter() + timeout
+    while True:
+        if before is not None:
+            count = clipboard_change_count()
+            if count != before:
+                return count
+        elif pyperclip.paste() == text:
+            return None
+        if time.perf_counter() >= deadline:
+            logging.warning(f"Clipboard not updated after {timeout * 1000:.0f} ms, pasting anyway")
+            return clipboard_change_count()
+        time.sleep(CLIPBOARD_POLL)
+
+
+def restore_clipboard(original: Optional[str], count: Optional[int]) -> bool:
+    """
+    Put *original* back on the clipboard, unless something else was copied
+    after our text (the change count moved on since *count*).
+    """
+    if original is None:
+        return False
+    if count is not None and clipboard_change_count() != count:
+        logging.debug("Clipboard changed since paste, not restoring")
+        return False
+    pyperclip.copy(original)
+    return True
+
+
+def press_backspace(count: int):
+    """Delete *count* characters, without pyautogui's per-call pause"""
+    if count > 0:
+        pyautogui.press('backspace', presses=count, _pause=False)
+
+
+def send_paste_shortcut():
+    """Send Command+V on macOS or Ctrl+V elsewhere"""
+    modifier = 'command' if platform.system() == 'Darwin' else 'ctrl'
+    pyautogui.hotkey(modifier, 'v', _pause=False)
+
+
+def _utf16_chunks(text: str, max_units: int) -> Iterator[str]:
+    """Split *text* into pieces of at most *max_units* UTF-16 code units"""
+    chunk: List[str] = []
+    units = 0
+    for ch in text:
+        width = 2 if ord(ch) > 0xFFFF else 1
+        if units + width > max_units:
+            yield "".join(chunk)
+            chunk, units = [], 0
+        chunk.append(ch)
+        units += width
+    if chunk:
+        yield "".join(chunk)
+
+
+def _type_text_mac(text: str):
+    """Post the text as Unicode keyboard events, 20 UTF-16 units at a time"""
+    from Quartz import (CGEventCreateKeyboardEvent, CGEventKeyboardSetUnicodeString, CGEventPost,
+                        CGEventSetFlags, kCGEventFlagMaskShift, kCGHIDEventTap)
+    return_key = 36
+    for i, line in enumerate(text.replace('\r\n', '\n').split('\n')):
+        if i:
+            for key_down in (True, False):
+                event = CGEventCreateKeyboardEvent(None, return_key, key_down)
+                CGEventSetFlags(event, kCGEventFlagMaskShift)
+                CGEventPost(kCGHIDEventTap, event)
+        for chunk in _utf16_chunks(line, MAC_CHUNK_UNITS):
+            units = len(chunk.encode('utf-16-le')) // 2
+            for key_down in (True, False):
+                event = CGEventCreateKeyboardEvent(None, 0, key_down)
+                CGEventKeyboardSetUnicodeString(event, units, chunk)
+                CGEventPost(kCGHIDEventTap, event)
+
+
+_win_input = None
+
+
+def _win_input_types():
+    """ctypes definitions for SendInput, built on first use"""
+    global _win_input
+    if _win_input is None:
+        import ctypes
+        from ctypes import wintypes
+
+        class KEYBDINPUT(ctypes.Structure):
+            _fields_ = [('wVk', wintypes.WORD), ('wScan', wintypes.WORD), ('dwFlags', wintypes.DWORD),
+                        ('time', wintypes.DWORD), ('dwExtraInfo', ctypes.c_size_t)]
+
+        class MOUSEINPUT(ctypes.Structure):
+            _fields_ = [('dx', wintypes.LONG), ('dy', wintypes.LONG), ('mouseData', wintypes.DWORD),
+                        ('dwFlags', wintypes.DWORD), ('time', wintypes.DWORD), ('dwExtraInfo', ctypes.c_size_t)]
+
+        class _INPUTUNION(ctypes.Union):
+            # sized like the largest member so sizeof(INPUT) matches the OS
+            _fields_ = [('ki', KEYBDINPUT), ('mi', MOUSEINPUT)]
+
+        class INPUT(ctypes.Structure):
+            _fields_ = [('type', wintypes.DWORD), ('u', _INPUTUNION)]
+
+        _win_input = (KEYBDINPUT, INPUT)
+    return _win_input
+
+
+def _type_text_windows(text: str):
+    """Send the whole text as KEYEVENTF_UNICODE input in a single SendInput call"""
+    import ctypes
+    KEYBDINPUT, INPUT = _win_input_types()
+    INPUT_KEYBOARD, KEYEVENTF_KEYUP, KEYEVENTF_UNICODE, VK_RETURN, VK_SHIFT = 1, 0x0002, 0x0004, 0x0D, 0x10
+
+    events = []
+
+    def add(**ki):
+        event = INPUT(type=INPUT_KEYBOARD)
+        event.u.ki = KEYBDINPUT(**ki)
+        events.append(event)
+
+    data = text.replace('\r\n', '\n').encode('utf-16-le')
+    for i in range(0, len(data), 2):
+        unit = int.from_bytes(data[i:i + 2], 'little')
+        if unit == 0x0A:
+            add(wVk=VK_SHIFT)
+            add(wVk=VK_RETURN)
+            add(wVk=VK_RETURN, dwFlags=KEYEVENTF_KEYUP)
+            add(wVk=VK_SHIFT, dwFlags=KEYEVENTF_KEYUP)
+        else:
+            for up in (0, KEYEVENTF_KEYUP):
+                add(wScan=unit, dwFlags=KEYEVENTF_UNICODE | up)
+
+    array = (INPUT * len(events))(*events)
+    sent = ctypes.windll.user32.SendInput(len(events), array, ctypes.sizeof(INPUT))
+    if sent != len(events):
+        logging.warning(f"SendInput injected {sent} of {len(events)} key events")
+
+
+def type_text(text: str):
+    """
+    Type *text* into the focused app with synthetic Unicode key events,
+    without going through the clipboard.  Line breaks are sent as
+    Shift+Return: a plain Return sends the message in Slack, Teams and
+    most other chat apps, while Shift+Return is a new line there and in
+    ordinary text fields.
+    """
+    system = platform.system()
+    if system == "Darwin":
+        _type_text_mac(text)
+    elif system == "Windows":
+        _type_text_windows(text)
+    else:
+        from pynput.keyboard import Controller, Key
+        controller = Controller()
+        for i, line in enumerate(text.replace('\r\n', '\n').split('\n')):
+            if i:
+                with controller.pressed(Key.shift):
+                    controller.tap(Key.enter)
+            controller.type(line)
+
+
+def paste_text(text: str, backend: str = 'clipboard'):
+    """
+    Insert *text* at the cursor.  The 'clipboard' backend copies it and sends
+    the paste shortcut, and returns (original clipboard, change count) for
+    restore_clipboard(); 'typing' injects key events and returns None.
+    """
+    if backend == 'typing':
+        type_text(text)
+        return None
+    try:
+        original = pyperclip.paste()
+    except Exception as e:
+        logging.error(f"Error saving clipboard: {e}")
+        original = None
+    count = copy_and_confirm(text)
+    send_paste_shortcut()
+    return original, count
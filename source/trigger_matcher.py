@@ -0,0 +1,178 @@
+from typing import Dict, Iterable, List, Optional
+
+
+class TriggerMatcher:
+    """
+    Incremental trigger phrase matcher for the keystroke hot path.
+
+    The trigger phrases are compiled into an Aho–Corasick automaton with a
+    complete transition table, so each key is one dict lookup and a few
+    integer operations no matter how many triggers there are.  The states
+    of the last HISTORY_SIZE keys are kept in a fixed ring buffer so
+    backspace can step the automaton back; nothing is allocated per key.
+
+    When a trigger is also the start of a longer one (':tt' and ':tt30'),
+    the shorter match is held back until the next key shows whether the
+    longer trigger is being typed.  In that case the match fires on the key
+    after the trigger, or from flush() when no key follows.  ``erase`` then
+    includes the extra characters typed; they are fed again from the root,
+    so they can start the next trigger (':tt:tt30'), and ``retype`` holds
+    them for the caller to type back after the expansion.  Callers reset() on keys that
+    aren't characters (Enter, arrows, Tab, ...), which drops a held-back
+    match along with everything typed before it.
+    """
+    HISTORY_SIZE = 32
+
+    def __init__(self, triggers: Iterable[str]):
+        self.triggers: List[str] = [t for t in dict.fromkeys(triggers) if t]
+
+        # Trie of the trigger phrases
+        children: List[Dict[str, int]] = [{}]
+        output: List[Optional[str]] = [None]
+        depth = [0]
+        for trigger in self.triggers:
+            state = 0
+            for ch in trigger:
+                nxt = children[state].get(ch)
+                if nxt is None:
+                    nxt = len(children)
+                    children[state][ch] = nxt
+                    children.append({})
+                    output.append(None)
+                    depth.append(depth[state] + 1)
+                state = nxt
+            output[state] = trigger
+
+        # Failure links (breadth first) folded into a complete transition
+        # table; characters that aren't in any trigger go back to the root
+        alphabet = set("".join(self.triggers))
+        delta: List[Dict[str, int]] = [dict() for _ in children]
+        fail = [0] * len(children)
+        order = []
+        for ch in alphabet:
+            nxt = children[0].get(ch, 0)
+            delta[0][ch] = nxt
+            if nxt:
+                order.append(nxt)
+        for state in order:
+            if output[state] is None:
+                output[state] = output[fail[state]]
+            for ch in alphabet:
+                nxt = children[state].get(ch)
+                if nxt is None:
+                    delta[state][ch] = delta[fail[state]][ch]
+                else:
+                    fail[nxt] = delta[fail[state]][ch]
+                    delta[state][ch] = nxt
+                    order.append(nxt)
+
+        self._delta = delta
+        self._output = output
+        self._depth = depth
+        # States from which a longer trigger can still be typed
+        self._extends = [bool(c) for c in children]
+
+        self._history = [0] * self.HISTORY_SIZE
+        self._pos = 0
+        self._length = 0
+        self._state = 0
+        self._pending: Optional[str] = None
+        self._pending_depth = 0
+        self._since_pending = 0
+        # Number of characters to delete for the last match returned by feed()
+        self.erase = 0
+        # Characters typed after a held-back match that it also erases, to
+        # be typed again after the expansion
+        self.retype = ''
+        self._kept = ''
+        # Keys fed or backspaced so far, so a caller can tell whether
+        # anything was typed since it looked at ``pending``
+        self.typed = 0
+
+    @property
+    def pending(self) -> Optional[str]:
+        """
+        The trigger the last key completed, if it is held back because a
+        longer trigger may still follow; None once more keys were typed
+        """
+        return self._pending if self._since_pending == 0 else None
+
+    def reset(self):
+        """Forget everything typed so far"""
+        self._pos = 0
+        self._length = 0
+        self._state = 0
+        self._pending = None
+
+    def feed(self, ch: str) -> Optional[str]:
+        """
+        Advance by one typed character.  Returns the trigger phrase when one
+        has just been completed (and sets ``erase``), otherwise None.
+        """
+        self.typed += 1
+        state = self._delta[self._state].get(ch, 0)
+
+        if self._pending is not None:
+            self._since_pending += 1
+            # Only real trie edges add exactly one level of depth per key
+            if self._depth[state] != self._pending_depth + self._since_pending:
+                # The longer trigger wasn't typed after all: fire the held-back
+                # one and carry on from the root with the keys typed after it.
+                # A trigger completed by those keys alone is not fired.
+                kept = self._kept + ch
+                trigger = self.flush()
+                erase = self.erase
+                for key in kept:
+                    self.feed(key)
+                self.erase, self.retype = erase, kept
+                return trigger
+            self._kept += ch
+
+        self._state = state
+        self._pos = (self._pos + 1) % self.HISTORY_SIZE
+        self._history[self._pos] = state
+        if self._length < self.HISTORY_SIZE - 1:
+            self._length += 1
+
+        trigger = self._output[state]
+        if trigger is None:
+            return None
+        if self._extends[state]:
+            self._pending = trigger
+            self._pending_depth = self._depth[state]
+            self._since_pending = 0
+            self._kept = ''
+            return None
+        self.erase = len(trigger)
+        self.retype = ''
+        self.reset()
+        return trigger
+
+    def flush(self) -> Optional[str]:
+        """
+        Fire the held-back trigger now, e.g. when no key followed it for a
+        while.  Returns it (and sets ``erase``), or None if there is none.
+        """
+        trigger = self._pending
+        if trigger is None:
+            return None
+        self.erase = len(trigger) + self._since_pending
+        self.retype = self._kept
+        self.reset()
+        return trigger
+
+    def backspace(self):
+        """Step back one character"""
+        self.typed += 1
+        if self._length == 0:
+            self._state = 0
+            self._pending = None
+            return
+        self._length -= 1
+        self._pos = (self._pos - 1) % self.HISTORY_SIZE
+        self._state = self._history[self._pos] if self._length else 0
+        if self._pending is not None:
+            self._since_pending -= 1
+            self._kept = self._kept[:-1]
+            if self._since_pending < 0:
+                self._pending = None